@@ -0,0 +1,229 @@
+import os
+
+# headless: set before pygame (and main, which opens its window on import) are loaded
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import math
+import platform
+import sys
+import time
+
+import numpy as np
+import pygame
+
+import main as fdf
+from main import BLACK, HEIGHT, WHITE, WIDTH, grid_vertices
+from tiles import TiledMesh
+from view import View
+from wireframe import draw_wireframe
+
+STAGES = ("transform", "project", "draw")
+PIPELINES = ("legacy", "vectorized", "tiled")
+# the per-frame input of every pipeline: a slow orbit with a slight zoom, like holding an arrow key and scrolling
+ORBIT = {"angle_x": 0.004, "angle_z": 0.01, "zoom": 1.002}
+
+
+def synthetic_heights(size: int, seed: int) -> np.ndarray:
+    # rolling hills plus noise, scaled to the same height range for every size so frames stay comparable
+    rng = np.random.default_rng(seed)
+    u = np.linspace(0, 4 * math.pi, size)
+    hills = np.sin(u)[:, None] * np.cos(0.7 * u)[None, :] + 0.5 * np.sin(2.3 * u + 1)[None, :]
+    return 40 * hills + rng.normal(0, 3, (size, size))
+
+
+# the original list-of-lists path: pure Python matrix products, one vec_to_xy per vertex and two polygons per cell
+def legacy_matrix_mult(m1: list, m2: list) -> list:
+    m3 = [[0 for _ in range(len(m2[0]))] for _ in range(len(m1))]
+    for i in range(len(m1)):
+        for j in range(len(m2[0])):
+            for k in range(len(m2)):
+                m3[i][j] += m1[i][k] * m2[k][j]
+    return m3
+
+
+def legacy_matrix_vec_mult(matrix: list, vector: list) -> list:
+    new_vector = [0 for _ in vector]
+    for i, row in enumerate(matrix):
+        for j, val in enumerate(row):
+            new_vector[i] += val * vector[j]
+    return new_vector
+
+
+def legacy_at_center(mat: list) -> list:
+    trans1 = [[1, 0, 0, -WIDTH / 2], [0, 1, 0, -HEIGHT / 2], [0, 0, 1, 0], [0, 0, 0, 1]]
+    trans2 = [[1, 0, 0, WIDTH / 2], [0, 1, 0, HEIGHT / 2], [0, 0, 1, 0], [0, 0, 0, 1]]
+    return legacy_matrix_mult(trans2, legacy_matrix_mult(mat, trans1))
+
+
+def legacy_compose(transform: list) -> list:
+    # zoom, then the x and z rotations, onto the accumulated transform
+    zoom = ORBIT["zoom"]
+    c, s = math.cos(ORBIT["angle_x"]), math.sin(ORBIT["angle_x"])
+    transform = legacy_matrix_mult(legacy_at_center([[zoom, 0, 0, 0], [0, zoom, 0, 0], [0, 0, zoom, 0],
+                                                     [0, 0, 0, 1]]), transform)
+    transform = legacy_matrix_mult(legacy_at_center([[1, 0, 0, 0], [0, c, -s, 0], [0, s, c, 0], [0, 0, 0, 1]]),
+                                   transform)
+    c, s = math.cos(ORBIT["angle_z"]), math.sin(ORBIT["angle_z"])
+    return legacy_matrix_mult(legacy_at_center([[c, -s, 0, 0], [s, c, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]]),
+                              transform)
+
+
+def legacy_project(grid: list, transform: list) -> list:
+    projected = []
+    for line in grid:
+        row = []
+        for v in line:
+            v2 = legacy_matrix_vec_mult(transform, v)
+            row.append([v2[0], HEIGHT - v2[1]])
+        projected.append(row)
+    return projected
+
+
+def legacy_draw(surface: pygame.Surface, projected: list):
+    for y, row in enumerate(projected):
+        for x, c1 in enumerate(row):
+            if x != 0 and y != 0:
+                c2, c3, c4 = projected[y][x - 1], projected[y - 1][x], c1
+                pygame.draw.polygon(surface, WHITE, [projected[y - 1][x - 1], c2, c3], width=2)
+                pygame.draw.polygon(surface, WHITE, [c2, c3, c4], width=2)
+
+
+def run_legacy(vertices: np.ndarray, frames: int, surface: pygame.Surface) -> dict[str, list[float]]:
+    grid = vertices.tolist()
+    transform = [[1, 0, 0, WIDTH // 2], [0, 1, 0, HEIGHT // 2], [0, 0, 1, 0], [0, 0, 0, 1]]
+    times = {stage: [] for stage in STAGES}
+    for _ in range(frames):
+        t0 = time.perf_counter()
+        transform = legacy_compose(transform)
+        t1 = time.perf_counter()
+        projected = legacy_project(grid, transform)
+        t2 = time.perf_counter()
+        surface.fill(BLACK)
+        legacy_draw(surface, projected)
+        t3 = time.perf_counter()
+        times["transform"].append(t1 - t0)
+        times["project"].append(t2 - t1)
+        times["draw"].append(t3 - t2)
+    return times
+
+
+def compose(view: View) -> np.ndarray:
+    view.zoom(ORBIT["zoom"])
+    view.rotate(0, ORBIT["angle_x"])
+    view.rotate(2, ORBIT["angle_z"])
+    return view.matrix
+
+
+def run_vectorized(vertices: np.ndarray, frames: int, surface: pygame.Surface) -> dict[str, list[float]]:
+    # the whole grid projected in one matmul through fdf.project and drawn as polylines, no culling
+    view = View((WIDTH / 2, HEIGHT / 2))
+    buffer = None
+    times = {stage: [] for stage in STAGES}
+    for _ in range(frames):
+        t0 = time.perf_counter()
+        mat = compose(view)
+        t1 = time.perf_counter()
+        buffer = fdf.project(vertices, mat, buffer)
+        t2 = time.perf_counter()
+        surface.fill(BLACK)
+        draw_wireframe(surface, buffer, WHITE)
+        t3 = time.perf_counter()
+        times["transform"].append(t1 - t0)
+        times["project"].append(t2 - t1)
+        times["draw"].append(t3 - t2)
+    return times
+
+
+def run_tiled(vertices: np.ndarray, frames: int, surface: pygame.Surface) -> dict[str, list[float]]:
+    # what fdf draws: culling, stride picking and projection happen in update(), draw_grid then only draws
+    view = View((WIDTH / 2, HEIGHT / 2))
+    mesh = TiledMesh(vertices)
+    times = {stage: [] for stage in STAGES}
+    for _ in range(frames):
+        t0 = time.perf_counter()
+        fdf.transform_mat = compose(view)
+        t1 = time.perf_counter()
+        mesh.update(fdf.transform_mat, *surface.get_size())
+        t2 = time.perf_counter()
+        surface.fill(BLACK)
+        fdf.draw_grid(mesh)
+        t3 = time.perf_counter()
+        times["transform"].append(t1 - t0)
+        times["project"].append(t2 - t1)
+        times["draw"].append(t3 - t2)
+    return times
+
+
+RUNNERS = {"legacy": run_legacy, "vectorized": run_vectorized, "tiled": run_tiled}
+
+
+def run_map(size: int, pipeline: str, frames: int, seed: int) -> dict:
+    vertices = grid_vertices(synthetic_heights(size, seed))
+    # one untimed frame first, so buffers and tile blocks are not billed to the first measured frame
+    RUNNERS[pipeline](vertices, 1, fdf.WINDOW)
+    times = RUNNERS[pipeline](vertices, frames, fdf.WINDOW)
+    frame = np.sum([times[stage] for stage in STAGES], axis=0)
+    median = float(np.median(frame))
+    return {
+        "key": f"{pipeline}-{size}",
+        "pipeline": pipeline,
+        "size": size,
+        "vertices": size * size,
+        "frames": frames,
+        "stages": {stage: {"median": float(np.median(times[stage])), "p99": float(np.percentile(times[stage], 99))}
+                   for stage in STAGES},
+        "frame": {"median": median, "p99": float(np.percentile(frame, 99))},
+        "fps": 1 / median if median else math.inf,
+        "vertices_per_sec": size * size / median if median else math.inf,
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Headless fdf frame time benchmark on synthetic maps")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[25, 100, 250, 500, 1000, 2000],
+                        help="map side lengths, in vertices")
+    parser.add_argument("--pipelines", nargs="+", default=list(PIPELINES), choices=PIPELINES)
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--legacy-max", type=int, default=250,
+                        help="largest map side the legacy path is run on, its frames take seconds beyond this")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "screen": [WIDTH, HEIGHT],
+        "seed": args.seed,
+        "frames": args.frames,
+        "legacy_max": args.legacy_max,
+        "maps": [],
+    }
+    for size in args.sizes:
+        for pipeline in args.pipelines:
+            if pipeline == "legacy" and size > args.legacy_max:
+                results["maps"].append({"key": f"{pipeline}-{size}", "pipeline": pipeline, "size": size,
+                                        "skipped": f"larger than --legacy-max {args.legacy_max}"})
+                continue
+            result = run_map(size, pipeline, args.frames, args.seed)
+            results["maps"].append(result)
+            print(f"{result['key']}: {result['frame']['median'] * 1000:.2f} ms/frame, "
+                  f"{result['vertices_per_sec']:.3g} vertices/sec", file=sys.stderr)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
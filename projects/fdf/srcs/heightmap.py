@@ -0,0 +1,102 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+# lines are parsed in chunks of about this many bytes, so only one chunk of text is alive at a time
+CHUNK_BYTES = 1 << 22
+DEFAULT_COLOR = 0xFFFFFF
+
+
+def parse_fdf(path: str) -> tuple[np.ndarray, np.ndarray | None]:
+    # classic .fdf text: one row of whitespace separated heights per line, each optionally suffixed with ,0xRRGGBB;
+    # returns float32 heights and uint32 colors, or None when the file has no colors
+    heights, colors = [], []
+    cols = None
+    line_number = 0
+    with open(path) as f:
+        while lines := f.readlines(CHUNK_BYTES):
+            rows = [line.split() for line in lines]
+            if cols is None:
+                cols = next((len(row) for row in rows if row), None)
+            # blank lines are skipped, every other row must be as long as the first one
+            for i, row in enumerate(rows):
+                if row and len(row) != cols:
+                    raise ValueError(f"{path}:{line_number + i + 1}: expected {cols} values, found {len(row)}")
+            line_number += len(lines)
+            lines = [line for line, row in zip(lines, rows) if row]
+            if not lines:
+                continue
+            text = "".join(lines)
+            if "," in text:
+                tokens = [token.partition(",") for row in rows for token in row]
+                z = np.array([height for height, _, _ in tokens], dtype=np.float32)
+                c = np.array([int(color, 16) if color else DEFAULT_COLOR for _, _, color in tokens], dtype=np.uint32)
+            else:
+                # C speed for the common uncolored case
+                z = np.fromstring(text, dtype=np.float32, sep=" ")
+                c = None
+            if len(z) != len(lines) * cols:
+                raise ValueError(f"{path}: every value must be a number")
+            heights.append(z)
+            colors.append(c)
+    if cols is None:
+        raise ValueError(f"{path}: empty map")
+
+    grid = np.concatenate(heights).reshape(-1, cols)
+    if all(c is None for c in colors):
+        return grid, None
+    colors = [np.full(len(z), DEFAULT_COLOR, dtype=np.uint32) if c is None else c for z, c in zip(heights, colors)]
+    return grid, np.concatenate(colors).reshape(-1, cols)
+
+
+def is_fresh(sidecar: str, source: str) -> bool:
+    return os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(source)
+
+
+def save_sidecar(path: str, array: np.ndarray):
+    # written to a temporary file first so an interrupted save never leaves a fresh looking, truncated sidecar
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        np.save(f, array)
+    os.replace(temporary, path)
+
+
+def load_heightmap(path: str, cache: bool = True) -> tuple[np.ndarray, np.ndarray | None]:
+    # the first load parses the text and saves path.npy (and path.colors.npy) next to it, later loads memory map
+    # those, so only the pages that are touched get read
+    sidecar = path + ".npy"
+    color_sidecar = path + ".colors.npy"
+    if cache and is_fresh(sidecar, path):
+        heights = np.load(sidecar, mmap_mode="r")
+        colors = np.load(color_sidecar, mmap_mode="r") if is_fresh(color_sidecar, path) else None
+        return heights, colors
+
+    heights, colors = parse_fdf(path)
+    if cache:
+        try:
+            save_sidecar(sidecar, heights)
+            if colors is not None:
+                save_sidecar(color_sidecar, colors)
+        except OSError:
+            # read-only map directories just parse every time
+            pass
+    return heights, colors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="parse a .fdf map and time the cached reload")
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    for attempt in ("load", "reload"):
+        start = time.perf_counter()
+        heights, colors = load_heightmap(args.path)
+        elapsed = time.perf_counter() - start
+        print(f"{attempt}: {heights.shape[0]}x{heights.shape[1]}, "
+              f"{'with' if colors is not None else 'no'} colors, {elapsed * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,15 @@
+import argparse
 import math
 
+import numpy as np
 import pygame
 
+from heightmap import load_heightmap
+from rasterizer import Rasterizer
+from terrain import StreamedMesh, TerrainStore
+from tiles import TiledMesh
+from view import View
+
 # Initialize Pygame
 pygame.init()
 
@@ -15,14 +23,18 @@ WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
 
 # types
-t_vec4 = list[int, int, int, int]
-t_vec2 = list[int, int]
-t_mat = list[t_vec4, t_vec4, t_vec4, t_vec4]
+t_vec4 = np.ndarray  # (4,) homogeneous point
+t_vec2 = np.ndarray  # (2,) screen point
+t_mat = np.ndarray  # (4, 4)
 
 
 # grid def
-def get_grid() -> list[list[t_vec4]]:
-    grid = [
+def get_grid(path: str | None = None) -> tuple[np.ndarray, np.ndarray | None]:
+    # the vertices and the file's per vertex colors, None when the map has none
+    if path:
+        heights, colors = load_heightmap(path)
+        return grid_vertices(heights), colors
+    heights = np.array([
         [10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10],
         [10, 20, 20, 20, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10],
         [10, 10, 30, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10],
@@ -47,66 +59,74 @@ def get_grid() -> list[list[t_vec4]]:
         [10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10],
         [10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10],
         [10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10, 10],
-    ]
-    GAP = min(WIDTH, HEIGHT) / max(len(grid), len(grid[0])) / 2
+    ], dtype=float)
+    return grid_vertices(heights), None
+
+
+def grid_layout(rows: int, cols: int) -> tuple[float, int, int]:
+    # spacing between vertices and the row/column index that lands on the origin
+    GAP = min(WIDTH, HEIGHT) / max(rows, cols) / 2
+    mid_x = rows // 2
+    mid_y = cols // 2
+    return GAP, mid_x, mid_y
+
+
+def grid_vertices(heights: np.ndarray) -> np.ndarray:
+    # (rows, cols, 4) float array of (x, y, z, 1), contiguous so reshape(-1, 4) is the (N, 4) vertex block
+    rows, cols = heights.shape
+    GAP, mid_x, mid_y = grid_layout(rows, cols)
     DISPLACE = 0
-    mid_x = len(grid) // 2
-    mid_y = len(grid[0]) // 2
-    return [[[(x - mid_x) * GAP + DISPLACE, (y - mid_y) * GAP + DISPLACE, z, 1]
-             for x, z in enumerate(row)] for y, row in enumerate(grid)]
+    vertices = np.empty((rows, cols, 4))
+    vertices[..., 0] = (np.arange(cols) - mid_x) * GAP + DISPLACE
+    vertices[..., 1] = ((np.arange(rows) - mid_y) * GAP + DISPLACE)[:, None]
+    vertices[..., 2] = heights
+    vertices[..., 3] = 1
+    return vertices
 
 
-transform_mat: t_mat = [
+transform_mat: t_mat = np.array([
     [1, 0, 0, WIDTH // 2],
     [0, 1, 0, HEIGHT // 2],
     [0, 0, 1, 0],
     [0, 0, 0, 1],
-]
+], dtype=float)
 
 
 def matrix_matrix_mult(m1: t_mat, m2: t_mat) -> t_mat:
-    m3 = [[0 for _ in range(len(m2[0]))] for _ in range(len(m1))]
-    for i in range(len(m1)):
-        for j in range(len(m2[0])):
-            for k in range(len(m2)):
-                m3[i][j] += m1[i][k] * m2[k][j]
-    return m3
+    return np.asarray(m1, dtype=float) @ np.asarray(m2, dtype=float)
 
 
 def matrix_vec_mult(matrix: t_mat, vector: t_vec4) -> t_vec4:
-    new_vector = [0 for _ in vector]
-    for i, row in enumerate(matrix):
-        for j, val in enumerate(row):
-            new_vector[i] += val * vector[j]
-    return new_vector
+    return np.asarray(matrix, dtype=float) @ np.asarray(vector, dtype=float)
 
 
-def vec_to_xy(v: t_vec4) -> t_vec2:
-    v2 = matrix_vec_mult(transform_mat, v)
-    return [v2[0], HEIGHT - v2[1]]
+def project(vertices: np.ndarray, mat: t_mat, out: np.ndarray | None = None) -> np.ndarray:
+    # (..., 4) vertices to (..., 2) screen points in one matrix multiply, only the x and y rows are needed
+    shape = vertices.shape[:-1] + (2,)
+    if out is None or out.shape != shape:
+        out = np.empty(shape)
+    np.matmul(vertices, mat[:2].T, out=out)
+    out[..., 1] = HEIGHT - out[..., 1]
+    return out
 
 
-def draw_square(c1: t_vec2, c2: t_vec2, c3: t_vec2, c4: t_vec2):
-    pygame.draw.polygon(WINDOW, WHITE, [c1, c2, c3], width=2)
-    pygame.draw.polygon(WINDOW, WHITE, [c2, c3, c4], width=2)
+def vec_to_xy(v: t_vec4) -> t_vec2:
+    return project(np.asarray(v, dtype=float), transform_mat)
 
 
 # Function to draw grid
-def draw_grid(grid: list[list[t_vec4]]) -> None:
-    grid = [[vec_to_xy(v) for v in line] for line in grid]
-    for y, row in enumerate(grid):
-        for x, c1 in enumerate(row):
-            if x != 0 and y != 0:
-                draw_square(grid[y - 1][x - 1], grid[y][x - 1], grid[y - 1][x], c1)
+def draw_grid(mesh: TiledMesh) -> None:
+    # off-screen tiles are culled and the rest drawn at a stride that matches their size on screen
+    mesh.draw(WINDOW, transform_mat, WHITE)
 
 
 def create_translation_matrix(x, y, z) -> t_mat:
-    return [
+    return np.array([
         [1, 0, 0, x],
         [0, 1, 0, y],
         [0, 0, 1, z],
         [0, 0, 0, 1],
-    ]
+    ], dtype=float)
 
 
 def apply_at_center(mat: t_mat) -> t_mat:
@@ -158,11 +178,24 @@ def create_rotation_matrix_z(angle) -> t_mat:
     ])
 
 
-def main():
+def main(path: str | None = None, raster: bool = False, cache_mb: int = 256):
     global transform_mat
-    grid = get_grid()
+    store = None
+    rasterizer = None
+    if path and path.endswith(".terrain"):
+        # chunks are paged in by the store's loader thread as they come into view
+        store = TerrainStore(path, cache_mb << 20)
+        mesh = StreamedMesh(store, *grid_layout(*store.shape))
+    else:
+        grid, colors = get_grid(path)
+        # the rasterizer draws the whole map with depth and color, the tiled wireframe culls and strides instead
+        rasterizer = Rasterizer(grid, colors) if raster else None
+        mesh = TiledMesh(grid) if not raster else None
+    view = View((WIDTH / 2, HEIGHT / 2))
+    clock = pygame.time.Clock()
     running = True
     last_mouse_pos = None
+    drawn_version = None
 
     while running:
         zoom_factor = 1
@@ -171,6 +204,8 @@ def main():
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
+            elif event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                drawn_version = None
             elif event.type == pygame.MOUSEMOTION:
                 if pygame.mouse.get_pressed()[0]:  # Left mouse button is pressed
                     if last_mouse_pos:
@@ -211,18 +246,39 @@ def main():
             angle_z -= 0.01
         # print(trans_x, trans_y, trans_z)
 
-        transform_mat = matrix_matrix_mult(create_zoom_matrix(zoom_factor), transform_mat)
-        transform_mat = matrix_matrix_mult(create_rotation_matrix_x(angle_x), transform_mat)
-        transform_mat = matrix_matrix_mult(create_rotation_matrix_y(angle_y), transform_mat)
-        transform_mat = matrix_matrix_mult(create_rotation_matrix_z(angle_z), transform_mat)
-        transform_mat = matrix_matrix_mult(create_translation_matrix(trans_x, trans_y, trans_z), transform_mat)
-        # print(transform_mat)
-        WINDOW.fill(BLACK)
-        draw_grid(grid)
-        pygame.display.flip()
-
+        # same order as composing zoom, x, y, z rotations and translation onto the transform, but only when a
+        # key or the mouse actually changed something
+        view.zoom(zoom_factor)
+        view.rotate(0, angle_x)
+        view.rotate(1, angle_y)
+        view.rotate(2, angle_z)
+        view.translate(trans_x, trans_y, trans_z)
+
+        # an idle view leaves the last frame on screen, until newly streamed chunks need drawing
+        frame_version = (view.version, mesh.revision() if mesh is not None else 0)
+        if frame_version != drawn_version:
+            transform_mat = view.matrix
+            if rasterizer is not None:
+                rasterizer.render(WINDOW, transform_mat, BLACK)
+            else:
+                WINDOW.fill(BLACK)
+                draw_grid(mesh)
+            pygame.display.flip()
+            drawn_version = frame_version
+        clock.tick(60)
+
+    if store is not None:
+        store.close()
     pygame.quit()
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="wireframe heightmap viewer")
+    parser.add_argument("map", nargs="?", help=".fdf heightmap or .terrain chunk file (see terrain.py), the built-in "
+                                               "grid when omitted")
+    parser.add_argument("--raster", action="store_true", help="z-buffered, height colored software rasterizer")
+    parser.add_argument("--cache-mb", type=int, default=256, help="chunk cache size when streaming a .terrain file")
+    args = parser.parse_args()
+    if args.raster and args.map and args.map.endswith(".terrain"):
+        parser.error("--raster needs the whole map, it cannot stream a .terrain file")
+    main(args.map, args.raster, args.cache_mb)
@@ -0,0 +1,170 @@
+import numpy as np
+import pygame
+
+# (height fraction, rgb) stops of the default coloring, low to high
+HEIGHT_GRADIENT = (
+    (0.0, (40, 70, 200)),
+    (0.3, (60, 170, 80)),
+    (0.6, (150, 110, 60)),
+    (1.0, (255, 255, 255)),
+)
+# line samples generated per batch, bounds the temporaries of a frame
+BATCH_SAMPLES = 1 << 21
+# below this many pixels per cell the grid is rasterized at a power-of-two stride, finer edges only overdraw
+MIN_CELL_PIXELS = 3.0
+
+
+def grid_edges(rows: int, cols: int, diagonals: bool = True) -> tuple[np.ndarray, np.ndarray]:
+    # start and end vertex of every unique edge of a rows x cols grid, as indices into its flattened vertices;
+    # the diagonals are the same anti-diagonals wireframe draws
+    index = np.arange(rows * cols).reshape(rows, cols)
+    starts = [index[:, :-1].ravel(), index[:-1, :].ravel()]
+    ends = [index[:, 1:].ravel(), index[1:, :].ravel()]
+    if diagonals:
+        starts.append(index[1:, :-1].ravel())
+        ends.append(index[:-1, 1:].ravel())
+    return np.concatenate(starts), np.concatenate(ends)
+
+
+def height_colors(heights: np.ndarray) -> np.ndarray:
+    # (N, 3) float rgb from the gradient, spread over the map's own height range
+    low, high = float(heights.min(initial=0)), float(heights.max(initial=0))
+    fraction = (heights - low) / (high - low) if high > low else np.zeros(len(heights))
+    stops = [stop for stop, _ in HEIGHT_GRADIENT]
+    return np.stack([np.interp(fraction, stops, [color[channel] for _, color in HEIGHT_GRADIENT])
+                     for channel in range(3)], axis=1)
+
+
+def file_colors(colors: np.ndarray) -> np.ndarray:
+    # 0xRRGGBB values from the map file to (N, 3) float rgb
+    colors = np.asarray(colors, dtype=np.uint32).ravel()
+    return np.stack(((colors >> 16) & 255, (colors >> 8) & 255, colors & 255), axis=1).astype(float)
+
+
+def clip_segments(a: np.ndarray, b: np.ndarray, width: int,
+                  height: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Liang-Barsky against the screen rectangle for all segments at once; returns the kept segment indices and the
+    # [t0, t1] part of each that is on screen
+    dx, dy = b[:, 0] - a[:, 0], b[:, 1] - a[:, 1]
+    t0, t1 = np.zeros(len(a)), np.ones(len(a))
+    keep = np.ones(len(a), dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for p, q in ((-dx, a[:, 0]), (dx, width - 1 - a[:, 0]), (-dy, a[:, 1]), (dy, height - 1 - a[:, 1])):
+            # inside where p * t <= q
+            r = q / p
+            t0 = np.where(p < 0, np.maximum(t0, r), t0)
+            t1 = np.where(p > 0, np.minimum(t1, r), t1)
+            keep &= (p != 0) | (q >= 0)
+    keep &= t0 <= t1
+    return np.flatnonzero(keep), t0[keep], t1[keep]
+
+
+class Level:
+    # every stride-th row and column of the grid (always keeping the last ones) with its edges and colors
+    def __init__(self, vertices: np.ndarray, colors: np.ndarray, stride: int, diagonals: bool):
+        rows = np.unique(np.append(np.arange(0, vertices.shape[0], stride), vertices.shape[0] - 1))
+        cols = np.unique(np.append(np.arange(0, vertices.shape[1], stride), vertices.shape[1] - 1))
+        self.vertices = vertices[np.ix_(rows, cols)].reshape(-1, 4).astype(np.float32)
+        self.colors = colors[np.ix_(rows, cols)].reshape(-1, 3)
+        self.starts, self.ends = grid_edges(len(rows), len(cols), diagonals)
+        self.points = np.empty((len(self.vertices), 3), dtype=np.float32)
+
+
+class Rasterizer:
+    def __init__(self, vertices: np.ndarray, colors: np.ndarray | None = None, diagonals: bool = True):
+        # vertices is the (rows, cols, 4) grid, colors the map file's 0xRRGGBB per vertex or None for the gradient
+        self.grid = vertices
+        self.diagonals = diagonals
+        rows, cols = vertices.shape[:2]
+        flat = vertices.reshape(-1, 4)
+        vertex_colors = file_colors(colors) if colors is not None else height_colors(flat[:, 2])
+        self.vertex_colors = vertex_colors.astype(np.float32).reshape(rows, cols, 3)
+        # one step along a row and along a column on the ground plane, to measure a cell on screen without the
+        # height differences
+        self.cell_steps = np.array([vertices[0, min(1, cols - 1), :3] - vertices[0, 0, :3],
+                                    vertices[min(1, rows - 1), 0, :3] - vertices[0, 0, :3]])
+        self.cell_steps[:, 2] = 0
+        self.levels: dict[int, Level] = {}
+        self.depth: np.ndarray | None = None
+        self.frame: np.ndarray | None = None
+
+    def level(self, mat: np.ndarray) -> Level:
+        # the stride that keeps a cell about MIN_CELL_PIXELS on screen, built once per stride
+        pixels = np.hypot(*(self.cell_steps @ mat[:2, :3].T).T).max(initial=0)
+        stride = 1
+        limit = max(self.grid.shape[:2])
+        while pixels * stride < MIN_CELL_PIXELS and stride < limit:
+            stride *= 2
+        if stride not in self.levels:
+            self.levels[stride] = Level(self.grid, self.vertex_colors, stride, self.diagonals)
+        return self.levels[stride]
+
+    def render(self, surface: pygame.Surface, mat: np.ndarray, background=(0, 0, 0)) -> int:
+        # the whole grid into the surface, nearest edge wins per pixel; returns the number of line samples
+        width, height = surface.get_size()
+        if self.frame is None or self.frame.shape != (width * height, 3):
+            # x-major like surfarray, pixel (x, y) is x * height + y
+            self.depth = np.empty(width * height, dtype=np.float32)
+            self.frame = np.empty((width * height, 3), dtype=np.uint8)
+        level = self.level(mat)
+        points = level.points
+        np.matmul(level.vertices, mat[:3].T.astype(np.float32), out=points)
+        points[:, 1] = height - points[:, 1]
+        # screen z grows towards the viewer, so the depth test keeps the largest
+        self.depth.fill(-np.inf)
+        self.frame[:] = background
+
+        # outcodes per vertex: edges whose ends share an outside side are dropped, edges with both ends on screen
+        # are drawn whole and only the rest are clipped
+        x, y = points[:, 0], points[:, 1]
+        codes = (x < 0) * 1 | (x > width - 1) * 2 | (y < 0) * 4 | (y > height - 1) * 8
+        code_a, code_b = codes[level.starts], codes[level.ends]
+        inside = np.flatnonzero((code_a | code_b) == 0)
+        crossing = np.flatnonzero(((code_a | code_b) != 0) & ((code_a & code_b) == 0))
+        kept, t0, t1 = clip_segments(points[level.starts[crossing]], points[level.ends[crossing]], width, height)
+        segments = np.concatenate((inside, crossing[kept]))
+        t0 = np.concatenate((np.zeros(len(inside)), t0)).astype(np.float32)[:, None]
+        span = np.concatenate((np.ones(len(inside)), t1 - t0[len(inside):, 0])).astype(np.float32)[:, None]
+
+        # the on-screen part of each edge as origin plus delta, for position and depth and for color
+        starts, ends = level.starts[segments], level.ends[segments]
+        origin, delta = points[starts], points[ends] - points[starts]
+        origin += t0 * delta
+        delta *= span
+        color, color_delta = level.colors[starts], level.colors[ends] - level.colors[starts]
+        color += t0 * color_delta
+        color_delta *= span
+        samples = self.draw_segments(origin, delta, color, color_delta, height)
+        pygame.surfarray.blit_array(surface, self.frame.reshape(width, height, 3))
+        return samples
+
+    def draw_segments(self, origin: np.ndarray, delta: np.ndarray, color: np.ndarray, color_delta: np.ndarray,
+                      height: int) -> int:
+        # one sample per pixel step along the longer axis, generated in batches of about BATCH_SAMPLES; the end
+        # point is left to the edge that starts there
+        counts = np.maximum(np.ceil(np.abs(delta[:, :2]).max(axis=1, initial=0)), 1).astype(np.int64)
+        ends = np.cumsum(counts)
+        start = 0
+        while start < len(origin):
+            base = ends[start - 1] if start else 0
+            stop = max(int(np.searchsorted(ends, base + BATCH_SAMPLES, side="right")), start + 1)
+            part = slice(start, stop)
+            self.draw_batch(origin[part], delta[part], color[part], color_delta[part], counts[part], height)
+            start = stop
+        return int(ends[-1]) if len(ends) else 0
+
+    def draw_batch(self, origin: np.ndarray, delta: np.ndarray, color: np.ndarray, color_delta: np.ndarray,
+                   counts: np.ndarray, height: int):
+        segment = np.repeat(np.arange(len(origin)), counts)
+        t = (np.arange(len(segment)) - np.repeat(np.cumsum(counts) - counts, counts)).astype(np.float32)
+        t /= counts.astype(np.float32)[segment]
+        start, move = origin[segment], delta[segment]
+        x = np.rint(start[:, 0] + t * move[:, 0]).astype(np.int32)
+        y = np.rint(start[:, 1] + t * move[:, 1]).astype(np.int32)
+        pixel = x * height + y
+        depth = start[:, 2] + t * move[:, 2]
+        # z-buffer: the nearest depth per pixel first, then only the samples that reach it write their color
+        np.maximum.at(self.depth, pixel, depth)
+        nearest = np.flatnonzero(depth >= self.depth[pixel])
+        segment = segment[nearest]
+        self.frame[pixel[nearest]] = color[segment] + t[nearest, None] * color_delta[segment]
@@ -0,0 +1,167 @@
+import argparse
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from heightmap import load_heightmap
+from tiles import TILE_SIZE, TiledMesh, tile_grid
+
+MAGIC = b"FDFTERR1"
+# magic, rows, cols, chunk size
+HEADER = struct.Struct("<8sqqq")
+# per chunk: where its float32 block starts, how many bytes it has and its min/max height
+INDEX_DTYPE = np.dtype([("offset", "<i8"), ("size", "<i8"), ("low", "<f4"), ("high", "<f4")])
+
+
+def write_terrain(path: str, heights: np.ndarray, chunk_size: int = TILE_SIZE):
+    # header, index, then every chunk as a row-major float32 block; chunks are the tile_grid blocks, so they share
+    # their boundary rows and columns. heights may be a memory map, only one band of chunk rows is read at a time
+    rows, cols = heights.shape
+    chunks = tile_grid(rows, cols, chunk_size)
+    index = np.zeros(len(chunks), dtype=INDEX_DTYPE)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, rows, cols, chunk_size))
+        f.seek(HEADER.size + index.nbytes)
+        band_start, band = None, None
+        for i, (r0, r1, c0, c1) in enumerate(chunks):
+            if band_start != r0:
+                band_start, band = r0, np.asarray(heights[r0:r1 + 1], dtype=np.float32)
+            block = np.ascontiguousarray(band[:, c0:c1 + 1])
+            index[i] = (f.tell(), block.nbytes, block.min(), block.max())
+            f.write(block.tobytes())
+        f.seek(HEADER.size)
+        f.write(index.tobytes())
+
+
+class TerrainStore:
+    def __init__(self, path: str, cache_bytes: int = 256 << 20):
+        # chunks are read by a background thread into an LRU cache of at most cache_bytes (the chunk just loaded
+        # is always kept); get() never waits for the disk
+        self.file = open(path, "rb")
+        magic, rows, cols, chunk_size = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a terrain file")
+        self.shape = (rows, cols)
+        self.chunk_size = chunk_size
+        self.chunks = tile_grid(rows, cols, chunk_size)
+        self.index = np.frombuffer(self.file.read(len(self.chunks) * INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)
+
+        self.cache_bytes = cache_bytes
+        self.cache: OrderedDict[int, np.ndarray] = OrderedDict()
+        self.cached_bytes = 0
+        # requested chunks in request order, the loader takes the newest first; requests that no longer fit in the
+        # cache are dropped, they would only evict each other
+        self.wanted: dict[int, None] = {}
+        self.max_wanted = max(1, cache_bytes // max(int(self.index["size"].max(initial=1)), 1))
+        # bumped after every load, so a mesh knows to look again
+        self.version = 0
+        self.loads = 0
+        self.evictions = 0
+        self.condition = threading.Condition()
+        self.running = True
+        self.loader = threading.Thread(target=self.load_loop, daemon=True)
+        self.loader.start()
+
+    def get(self, chunk: int) -> np.ndarray | None:
+        # the chunk's heights when resident, otherwise None and the chunk is queued for the loader
+        with self.condition:
+            heights = self.cache.get(chunk)
+            if heights is not None:
+                self.cache.move_to_end(chunk)
+                return heights
+            self.wanted.pop(chunk, None)
+            self.wanted[chunk] = None
+            while len(self.wanted) > self.max_wanted:
+                del self.wanted[next(iter(self.wanted))]
+            self.condition.notify()
+            return None
+
+    def load_loop(self):
+        # only this thread reads the file after __init__
+        while True:
+            with self.condition:
+                while self.running and not self.wanted:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                chunk = next(reversed(self.wanted))
+                del self.wanted[chunk]
+                if chunk in self.cache:
+                    continue
+            r0, r1, c0, c1 = self.chunks[chunk]
+            self.file.seek(int(self.index["offset"][chunk]))
+            data = self.file.read(int(self.index["size"][chunk]))
+            heights = np.frombuffer(data, dtype=np.float32).reshape(r1 - r0 + 1, c1 - c0 + 1)
+            with self.condition:
+                self.insert(chunk, heights)
+
+    def insert(self, chunk: int, heights: np.ndarray):
+        self.cache[chunk] = heights
+        self.cached_bytes += heights.nbytes
+        self.loads += 1
+        while self.cached_bytes > self.cache_bytes and len(self.cache) > 1:
+            _, evicted = self.cache.popitem(last=False)
+            self.cached_bytes -= evicted.nbytes
+            self.evictions += 1
+        self.version += 1
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.loader.join()
+        self.file.close()
+
+
+class StreamedMesh(TiledMesh):
+    def __init__(self, store: TerrainStore, gap: float, mid_x: int, mid_y: int):
+        # a TiledMesh whose tiles are the store's chunks; the boxes come from the index, so culling and level
+        # picking never wait for data, and a tile is drawn from the first frame after its chunk arrives.
+        # gap, mid_x and mid_y place the grid like main.grid_layout
+        self.store = store
+        self.gap, self.mid_x, self.mid_y = gap, mid_x, mid_y
+        r0, r1, c0, c1 = np.array(store.chunks).reshape(-1, 4).T
+        low = np.stack(((c0 - mid_x) * gap, (r0 - mid_y) * gap, store.index["low"]), axis=1)
+        high = np.stack(((c1 - mid_x) * gap, (r1 - mid_y) * gap, store.index["high"]), axis=1)
+        self.setup(store.shape, store.chunks, store.chunk_size, low, high)
+
+    def revision(self) -> int:
+        return self.store.version
+
+    def block(self, tile: int, stride: int) -> np.ndarray | None:
+        heights = self.store.get(tile)
+        if heights is None:
+            return None
+        r0, r1, c0, c1 = self.tiles[tile]
+        rows = np.unique(np.append(np.arange(0, r1 - r0 + 1, stride), r1 - r0))
+        cols = np.unique(np.append(np.arange(0, c1 - c0 + 1, stride), c1 - c0))
+        block = np.empty((len(rows), len(cols), 4))
+        block[..., 0] = (c0 + cols - self.mid_x) * self.gap
+        block[..., 1] = ((r0 + rows - self.mid_y) * self.gap)[:, None]
+        block[..., 2] = heights[np.ix_(rows, cols)]
+        block[..., 3] = 1
+        return block
+
+
+def main():
+    parser = argparse.ArgumentParser(description="convert a .fdf map to a chunked .terrain file for streaming")
+    parser.add_argument("map")
+    parser.add_argument("out", nargs="?", help="defaults to the map path with .terrain")
+    parser.add_argument("--chunk", type=int, default=TILE_SIZE, help="cells per chunk side, a power of two")
+    args = parser.parse_args()
+
+    out = args.out or args.map.rsplit(".", 1)[0] + ".terrain"
+    start = time.perf_counter()
+    heights, _ = load_heightmap(args.map)
+    write_terrain(out, heights, args.chunk)
+    store = TerrainStore(out)
+    print(f"{out}: {heights.shape[0]}x{heights.shape[1]} in {len(store.chunks)} chunks, "
+          f"{time.perf_counter() - start:.1f}s")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import math
+
+import numpy as np
+import pygame
+
+from wireframe import draw_wireframe
+
+# cells per tile side
+TILE_SIZE = 64
+# finer detail than this many pixels per cell is skipped by striding through the tile
+MIN_CELL_PIXELS = 3.0
+
+
+def tile_grid(rows: int, cols: int, tile_size: int) -> list[tuple[int, int, int, int]]:
+    # (first row, last row, first column, last column) of square blocks of a rows x cols grid, row-major;
+    # neighbouring blocks share their boundary vertices
+    row_edges = list(range(0, max(rows - 1, 1), tile_size)) + [rows - 1]
+    col_edges = list(range(0, max(cols - 1, 1), tile_size)) + [cols - 1]
+    return [(r0, r1, c0, c1) for r0, r1 in zip(row_edges, row_edges[1:]) for c0, c1 in zip(col_edges, col_edges[1:])]
+
+
+class TiledMesh:
+    def __init__(self, vertices: np.ndarray, tile_size: int = TILE_SIZE):
+        # vertices is the (rows, cols, 4) grid
+        self.vertices = vertices
+        tiles = tile_grid(*vertices.shape[:2], tile_size)
+        low, high = [], []
+        for r0, r1, c0, c1 in tiles:
+            block = vertices[r0:r1 + 1, c0:c1 + 1, :3]
+            low.append(block.min(axis=(0, 1)))
+            high.append(block.max(axis=(0, 1)))
+        self.setup(vertices.shape[:2], tiles, tile_size, np.array(low), np.array(high))
+
+    def setup(self, shape: tuple[int, int], tiles: list[tuple[int, int, int, int]], tile_size: int, low: np.ndarray,
+              high: np.ndarray):
+        # low and high are the (tiles, 3) corners of each tile's world space box, with its min/max height
+        self.shape = shape
+        self.tiles = tiles
+        self.tile_size = tile_size
+        low, high = low.reshape(-1, 3), high.reshape(-1, 3)
+        pick = np.array([[i >> axis & 1 for axis in range(3)] for i in range(8)], dtype=bool)
+        self.corners = np.ones((len(self.tiles), 8, 4))
+        self.corners[..., :3] = np.where(pick, high[:, None], low[:, None])
+        # cells along each side of the tile, the projected side over this is the on-screen size of a cell
+        self.side_cells = np.array([(max(c1 - c0, 1), max(r1 - r0, 1)) for r0, r1, c0, c1 in self.tiles],
+                                   dtype=float)
+
+        # per tile state, rebuilt only when its stride changes and dropped when the tile leaves the screen: the
+        # strided vertex block and its projection buffer
+        self.strides = [0] * len(self.tiles)
+        self.blocks: list[np.ndarray | None] = [None] * len(self.tiles)
+        self.buffers: list[np.ndarray | None] = [None] * len(self.tiles)
+        self.visible: list[int] = []
+        self.matrix: np.ndarray | None = None
+        self.screen: tuple[int, int] | None = None
+        self.drawn_revision = None
+
+    def __len__(self) -> int:
+        return len(self.tiles)
+
+    def revision(self) -> int:
+        # changes whenever block() may return something new for the same tile and stride
+        return 0
+
+    def block(self, tile: int, stride: int) -> np.ndarray | None:
+        # every stride-th vertex of the tile, always keeping its last row and column so neighbours still meet;
+        # None while the tile's data is not available
+        r0, r1, c0, c1 = self.tiles[tile]
+        if (r1 - r0) % stride == 0 and (c1 - c0) % stride == 0:
+            return self.vertices[r0:r1 + 1:stride, c0:c1 + 1:stride]
+        rows = np.unique(np.append(np.arange(r0, r1 + 1, stride), r1))
+        cols = np.unique(np.append(np.arange(c0, c1 + 1, stride), c1))
+        return self.vertices[np.ix_(rows, cols)]
+
+    def update(self, mat: np.ndarray, width: int, height: int):
+        # cull and pick levels from the projected tile boxes, then project only the visible tiles; an unchanged
+        # transform keeps last frame's buffers
+        if (self.matrix is not None and self.screen == (width, height) and self.drawn_revision == self.revision()
+                and np.array_equal(mat, self.matrix)):
+            return
+        self.matrix = mat.copy()
+        self.screen = (width, height)
+        self.drawn_revision = self.revision()
+
+        corners = self.corners @ mat[:2].T
+        corners[..., 1] = height - corners[..., 1]
+        low, high = corners.min(axis=1), corners.max(axis=1)
+        visible = (high[:, 0] >= 0) & (low[:, 0] <= width) & (high[:, 1] >= 0) & (low[:, 1] <= height)
+        # corner 0 is the low corner, 1 and 2 are one side along x (columns) and y (rows) away; the longer of the
+        # two on screen decides, so a tilted tile keeps the detail of its wide side
+        sides = np.hypot(*(corners[:, 1:3] - corners[:, :1]).transpose(2, 0, 1))
+        pixels = (sides / self.side_cells).max(axis=1)
+        levels = np.ceil(np.log2(MIN_CELL_PIXELS / np.maximum(pixels, 1e-9)))
+        strides = 2 ** np.clip(levels, 0, int(math.log2(self.tile_size))).astype(int)
+
+        projection = mat[:2].T
+        drawn = []
+        for tile in np.flatnonzero(visible).tolist():
+            stride = int(strides[tile])
+            if stride != self.strides[tile]:
+                block = self.block(tile, stride)
+                # a tile whose data is still on its way keeps its old stride, or waits if it has none yet
+                if block is not None:
+                    self.strides[tile] = stride
+                    self.blocks[tile] = block
+                    self.buffers[tile] = np.empty(block.shape[:2] + (2,))
+            if self.blocks[tile] is None:
+                continue
+            buffer = self.buffers[tile]
+            np.matmul(self.blocks[tile], projection, out=buffer)
+            buffer[..., 1] = height - buffer[..., 1]
+            drawn.append(tile)
+        for tile in set(self.visible).difference(drawn):
+            self.strides[tile] = 0
+            self.blocks[tile] = None
+            self.buffers[tile] = None
+        self.visible = drawn
+
+    def draw(self, surface: pygame.Surface, mat: np.ndarray, color, width: int = 2, diagonals: bool = True,
+             antialias: bool = False) -> int:
+        # a tile skips its last row and column unless it is on the map border, the next tile draws that seam
+        self.update(mat, *surface.get_size())
+        rows, cols = self.shape
+        calls = 0
+        for tile in self.visible:
+            _, r1, _, c1 = self.tiles[tile]
+            calls += draw_wireframe(surface, self.buffers[tile], color, width, diagonals, antialias,
+                                    last_row=r1 == rows - 1, last_col=c1 == cols - 1)
+        return calls
+
+    @property
+    def drawn_vertices(self) -> int:
+        return sum(self.buffers[tile].shape[0] * self.buffers[tile].shape[1] for tile in self.visible)
@@ -0,0 +1,103 @@
+import argparse
+import math
+import os
+import time
+from multiprocessing import get_context
+
+# headless: set before pygame (and main, which opens its window on import) are loaded
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+# SDL would turn the SIGTERM of Pool.terminate into a quit event and the workers would never exit
+os.environ.setdefault("SDL_NO_SIGNAL_HANDLERS", "1")
+
+import numpy as np
+import pygame
+
+from main import BLACK, HEIGHT, WHITE, WIDTH, get_grid
+from rasterizer import Rasterizer
+from tiles import TiledMesh
+from view import View
+
+# the renderer of the map this worker drew last and its (path, raster) key; tasks are map-major, so consecutive
+# tasks mostly share a map and only that one is kept, a renderer is tens of MB
+_renderer: tuple[tuple[str, bool], TiledMesh | Rasterizer] | None = None
+
+
+def camera(frame: int, frames: int, tilt: float, zoom_start: float, zoom_end: float,
+           size: tuple[int, int]) -> np.ndarray:
+    # one full orbit about the map's own vertical axis, tilted towards the viewer, zooming geometrically from
+    # zoom_start to zoom_end; maps are laid out for main's window, so the zoom is scaled to the output size
+    progress = frame / frames
+    view = View((size[0] / 2, size[1] / 2))
+    view.rotate(2, 2 * math.pi * progress)
+    view.rotate(0, tilt)
+    base = min(size) / min(WIDTH, HEIGHT)
+    view.zoom(base * zoom_start * (zoom_end / zoom_start) ** progress)
+    return view.matrix
+
+
+def render_frames(task: tuple) -> tuple[int, str, int, float]:
+    global _renderer
+    path, frames, indices, options = task
+    start = time.perf_counter()
+    key = (path, options["raster"])
+    if _renderer is None or _renderer[0] != key:
+        # dropped first, so the old map and the new one are never both held
+        _renderer = None
+        grid, colors = get_grid(path)
+        _renderer = key, Rasterizer(grid, colors) if options["raster"] else TiledMesh(grid)
+    renderer = _renderer[1]
+
+    size = options["size"]
+    surface = pygame.Surface(size)
+    directory = os.path.join(options["out"], os.path.splitext(os.path.basename(path))[0])
+    os.makedirs(directory, exist_ok=True)
+    for frame in indices:
+        mat = camera(frame, frames, options["tilt"], options["zoom_start"], options["zoom_end"], size)
+        if options["raster"]:
+            renderer.render(surface, mat, BLACK)
+        else:
+            surface.fill(BLACK)
+            renderer.draw(surface, mat, WHITE)
+        pygame.image.save(surface, os.path.join(directory, f"frame_{frame:04d}.png"))
+    return os.getpid(), path, len(indices), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="render turntable PNG sequences of .fdf maps without a display")
+    parser.add_argument("maps", nargs="+")
+    parser.add_argument("--out", default="turntable")
+    parser.add_argument("--frames", type=int, default=36, help="frames per full orbit")
+    parser.add_argument("--tilt", type=float, default=-0.9, help="rotation about the screen x axis, radians")
+    parser.add_argument("--zoom", type=float, nargs=2, default=(1.0, 1.0), metavar=("START", "END"))
+    parser.add_argument("--size", type=int, nargs=2, default=(WIDTH, HEIGHT), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--raster", action="store_true", help="z-buffered colored frames instead of wireframe")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk", type=int, default=12, help="frames per task, a task loads its map at most once")
+    args = parser.parse_args()
+
+    options = {"out": args.out, "tilt": args.tilt, "zoom_start": args.zoom[0], "zoom_end": args.zoom[1],
+               "size": tuple(args.size), "raster": args.raster}
+    tasks = [(path, args.frames, range(first, min(first + args.chunk, args.frames)), options)
+             for path in args.maps for first in range(0, args.frames, args.chunk)]
+
+    per_worker: dict[int, list[float]] = {}
+    start = time.perf_counter()
+    # spawned, not forked: a forked child would inherit the parent's SDL state
+    with get_context("spawn").Pool(args.workers) as pool:
+        for pid, path, frames, elapsed in pool.imap_unordered(render_frames, tasks):
+            totals = per_worker.setdefault(pid, [0, 0.0])
+            totals[0] += frames
+            totals[1] += elapsed
+        pool.close()
+        pool.join()
+    wall = time.perf_counter() - start
+
+    total = sum(frames for frames, _ in per_worker.values())
+    print(f"{total} frames of {len(args.maps)} maps in {wall:.1f}s, {total / wall:.1f} fps overall")
+    for pid, (frames, busy) in sorted(per_worker.items()):
+        print(f"  worker {pid}: {frames} frames, {frames / busy:.1f} fps")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import math
+
+import numpy as np
+
+# rotations between re-orthonormalizations of the accumulated rotation
+ORTHONORMALIZE_EVERY = 64
+
+
+def rotation_matrix(axis: int, angle: float) -> np.ndarray:
+    # 3x3 rotation about x (0), y (1) or z (2), with the same handedness as main's create_rotation_matrix_*
+    c, s = math.cos(angle), math.sin(angle)
+    i, j = ((1, 2), (2, 0), (0, 1))[axis]
+    m = np.eye(3)
+    m[i, i] = m[j, j] = c
+    m[i, j] = -s
+    m[j, i] = s
+    return m
+
+
+class View:
+    def __init__(self, center: tuple[float, float]):
+        # screen = scale * rotation @ world + offset; zoom and rotation pivot around the screen center, like
+        # apply_at_center, and the map starts centered on it
+        self.center = np.array([center[0], center[1], 0.0])
+        self.rotation = np.eye(3)
+        self.scale = 1.0
+        self.offset = self.center.copy()
+        self.rotations = 0
+        # bumped on every change, callers compare it with the version they last drew
+        self.version = 0
+        self._matrix: np.ndarray | None = None
+
+    def rotate(self, axis: int, angle: float):
+        if not angle:
+            return
+        rotation = rotation_matrix(axis, angle)
+        self.rotation = rotation @ self.rotation
+        self.offset = rotation @ (self.offset - self.center) + self.center
+        self.rotations += 1
+        if self.rotations % ORTHONORMALIZE_EVERY == 0:
+            self.orthonormalize()
+        self.changed()
+
+    def zoom(self, factor: float):
+        if factor == 1:
+            return
+        self.scale *= factor
+        self.offset = factor * (self.offset - self.center) + self.center
+        self.changed()
+
+    def translate(self, x: float, y: float, z: float = 0):
+        if not (x or y or z):
+            return
+        self.offset = self.offset + (x, y, z)
+        self.changed()
+
+    def orthonormalize(self):
+        # snap to the nearest rotation so rounding in the accumulated product never shears or scales the map
+        u, _, vt = np.linalg.svd(self.rotation)
+        self.rotation = u @ vt
+
+    def changed(self):
+        self.version += 1
+        self._matrix = None
+
+    @property
+    def matrix(self) -> np.ndarray:
+        # the 4x4 transform, composed once per change
+        if self._matrix is None:
+            self._matrix = np.eye(4)
+            self._matrix[:3, :3] = self.scale * self.rotation
+            self._matrix[:3, 3] = self.offset
+        return self._matrix
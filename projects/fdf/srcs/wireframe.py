@@ -0,0 +1,33 @@
+import numpy as np
+import pygame
+
+
+def grid_polylines(projected: np.ndarray, diagonals: bool = True, last_row: bool = True,
+                   last_col: bool = True) -> list[np.ndarray]:
+    # every unique edge of a (rows, cols, 2) grid of screen points exactly once: one polyline per row, one per
+    # column and, for the triangulated look, one per anti-diagonal (the shared edge of each cell's two triangles);
+    # all of them are views, pygame reads the points straight from the projection buffer.
+    # last_row/last_col False leave out the bottom row and right column for a neighbouring block to draw
+    rows, cols = projected.shape[:2]
+    polylines = []
+    if cols > 1:
+        polylines.extend(projected if last_row else projected[:-1])
+    if rows > 1:
+        polylines.extend(projected.transpose(1, 0, 2) if last_col else projected[:, :-1].transpose(1, 0, 2))
+    if diagonals and rows > 1 and cols > 1:
+        flipped = projected[:, ::-1]
+        # offsets whose anti-diagonal has at least two points
+        polylines.extend(flipped.diagonal(offset).T for offset in range(2 - rows, cols - 1))
+    return polylines
+
+
+def draw_wireframe(surface: pygame.Surface, projected: np.ndarray, color, width: int = 2, diagonals: bool = True,
+                   antialias: bool = False, last_row: bool = True, last_col: bool = True) -> int:
+    # O(rows + cols) draw calls instead of two polygons per cell; returns the number of calls
+    polylines = grid_polylines(projected, diagonals, last_row, last_col)
+    for line in polylines:
+        if antialias:
+            pygame.draw.aalines(surface, color, False, line)
+        else:
+            pygame.draw.lines(surface, color, False, line, width)
+    return len(polylines)
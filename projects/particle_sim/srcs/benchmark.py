@@ -0,0 +1,230 @@
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from particle import Particle
+from main import ParticleHandler
+from nbody import NBodyForces
+
+# parallel_step is the whole step of the shared memory array solver, the others stay 0 while it is used
+STAGES = ("gravity", "forces", "broad_phase", "narrow_phase", "integration", "parallel_step")
+
+RADIUS_DISTRIBUTIONS = {
+    "fixed": lambda rng: 3,
+    "uniform": lambda rng: rng.uniform(2, 6),
+    "bimodal": lambda rng: 2 if rng.random() < 0.7 else 6,
+}
+
+
+def spawn_scene(count: int, density: float, radius_dist: str, seed: int, elasticity: float = 1.0) -> ParticleHandler:
+    # density is the fraction of the (square) world covered by particles
+    # below 1 the particles lose energy on every contact and settle into a pile, which is what sleeping is for
+    rng = random.Random(seed)
+    radii = [RADIUS_DISTRIBUTIONS[radius_dist](rng) for _ in range(count)]
+    side = math.sqrt(sum(math.pi * r * r for r in radii) / density)
+    handler = ParticleHandler(side, side)
+    for radius in radii:
+        x = rng.uniform(radius, side - radius)
+        y = rng.uniform(radius, side - radius)
+        xv = rng.uniform(-2, 2)
+        yv = rng.uniform(-2, 2)
+        handler.add_particle(Particle(x, y, radius, (0, 255, 255), xv, yv, radius * 0.1, elasticity))
+    return handler
+
+
+def step_timed(handler: ParticleHandler, timings: dict[str, float]):
+    if handler.parallel is not None:
+        t0 = time.perf_counter()
+        handler.step()
+        timings["parallel_step"] += time.perf_counter() - t0
+        return
+    t0 = time.perf_counter()
+    handler.apply_gravity()
+    t1 = time.perf_counter()
+    handler.apply_forces()
+    t2 = time.perf_counter()
+    handler.assign_particles_to_grid()
+    t3 = time.perf_counter()
+    handler.resolve_collisions()
+    handler.collide_static()
+    t4 = time.perf_counter()
+    handler.update_particles()
+    t5 = time.perf_counter()
+    timings["gravity"] += t1 - t0
+    timings["forces"] += t2 - t1
+    timings["broad_phase"] += t3 - t2
+    timings["narrow_phase"] += t4 - t3
+    timings["integration"] += t5 - t4
+
+
+def measure_peak_memory(count: int, density: float, radius_dist: str, seed: int, elasticity: float) -> int:
+    # traced separately, tracemalloc would otherwise skew the timings
+    tracemalloc.start()
+    handler = spawn_scene(count, density, radius_dist, seed, elasticity)
+    handler.apply_gravity()
+    handler.collide_all()
+    handler.update_particles()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def run_scene(count: int, density: float, radius_dist: str, seed: int, frames: int, repeats: int,
+              sleep: bool = False, forces: str | None = None, contact_cache: bool = False,
+              elasticity: float = 1.0, settle_frames: int = 0, workers: int | None = None) -> dict:
+    # every repeat replays the same seeded scene, the fastest one is kept to filter out scheduler noise
+    timings = None
+    for _ in range(repeats):
+        handler = spawn_scene(count, density, radius_dist, seed, elasticity)
+        handler.sleep_enabled = sleep
+        if forces:
+            handler.forces = NBodyForces(forces)
+        if contact_cache:
+            handler.enable_contact_cache()
+        if workers:
+            handler.enable_parallel(workers)
+        # untimed warm up, with elasticity below 1 this lets the scene settle before it is measured
+        for _ in range(settle_frames):
+            step_timed(handler, {stage: 0.0 for stage in STAGES})
+        run_timings = {stage: 0.0 for stage in STAGES}
+        start_energy = handler.get_total_energy()
+        hits = contacts = moved = 0
+        for _ in range(frames):
+            step_timed(handler, run_timings)
+            if contact_cache:
+                hits += handler.contact_cache.hits
+                contacts += handler.contact_cache.hits + handler.contact_cache.misses
+                moved += handler.moved_particles
+        handler.disable_parallel()
+        end_energy = handler.get_total_energy()
+        if timings is None or sum(run_timings.values()) < sum(timings.values()):
+            timings = run_timings
+    total = sum(timings.values())
+    scene = {
+        "key": scene_key(count, density, radius_dist),
+        "count": count,
+        "density": density,
+        "radius_dist": radius_dist,
+        "frames": frames,
+        "repeats": repeats,
+        "steps_per_sec": frames / total if total else math.inf,
+        "stage_seconds": timings,
+        "stage_fraction": {stage: t / total if total else 0.0 for stage, t in timings.items()},
+        "peak_memory_bytes": measure_peak_memory(count, density, radius_dist, seed, elasticity),
+        "energy_start": start_energy,
+        "energy_end": end_energy,
+        "energy_drift": (end_energy - start_energy) / start_energy if start_energy else 0.0,
+        "awake_end": handler.awake_count,
+        "sleeping_end": handler.sleeping_count,
+    }
+    if contact_cache:
+        # the first frame fills the cache, so the hit ratio is averaged over every contact of the run
+        scene["contact_hit_ratio"] = hits / contacts if contacts else 0.0
+        scene["contact_evictions"] = handler.contact_cache.total_evictions
+        scene["moved_fraction"] = moved / (frames * count) if frames and count else 0.0
+    return scene
+
+
+def scene_key(count: int, density: float, radius_dist: str) -> str:
+    return f"{count}-{density}-{radius_dist}"
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    # only runs with the same seed, frame counts, elasticity, sleep and force settings are comparable
+    regressions = []
+    settings = ("seed", "frames", "settle_frames", "elasticity", "sleep", "forces", "contact_cache", "workers")
+    if any(baseline.get(key) != results[key] for key in settings):
+        return [f"baseline settings {[baseline.get(key) for key in settings]} differ from "
+                f"{[results[key] for key in settings]} ({', '.join(settings)})"]
+    old_scenes = {scene["key"]: scene for scene in baseline["scenes"]}
+    for scene in results["scenes"]:
+        old = old_scenes.get(scene["key"])
+        if old is None:
+            continue
+        ratio = scene["steps_per_sec"] / old["steps_per_sec"]
+        if ratio < 1 - tolerance:
+            regressions.append(f"{scene['key']}: {old['steps_per_sec']:.2f} -> "
+                               f"{scene['steps_per_sec']:.2f} steps/sec ({ratio - 1:+.1%})")
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Headless ParticleHandler benchmark")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 5000, 20000, 100000])
+    parser.add_argument("--densities", type=float, nargs="+", default=[0.05, 0.2])
+    parser.add_argument("--radius-dists", nargs="+", default=["fixed", "bimodal"],
+                        choices=sorted(RADIUS_DISTRIBUTIONS))
+    parser.add_argument("--frames", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--elasticity", type=float, default=1.0,
+                        help="particle elasticity, below 1 scenes settle into piles (use with --sleep)")
+    parser.add_argument("--settle-frames", type=int, default=0, help="untimed frames to run before measuring")
+    parser.add_argument("--sleep", action="store_true", help="let resting particles fall asleep")
+    parser.add_argument("--forces", choices=["barnes_hut", "direct"], help="add mutual n-body gravity")
+    parser.add_argument("--contact-cache", action="store_true",
+                        help="warm start from cached contacts and update the grid incrementally")
+    parser.add_argument("--workers", type=int,
+                        help="step with the shared memory array solver on this many processes (1 = in-process)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed fractional drop in steps/sec before a scene counts as a regression")
+    args = parser.parse_args(argv)
+    if args.workers and (args.sleep or args.contact_cache):
+        parser.error("--workers replaces the object solver, it cannot be combined with --sleep or --contact-cache")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "frames": args.frames,
+        "settle_frames": args.settle_frames,
+        "elasticity": args.elasticity,
+        "sleep": args.sleep,
+        "forces": args.forces,
+        "contact_cache": args.contact_cache,
+        "workers": args.workers,
+        "scenes": [],
+    }
+    for count in args.counts:
+        for density in args.densities:
+            for radius_dist in args.radius_dists:
+                scene = run_scene(count, density, radius_dist, args.seed, args.frames, args.repeats, args.sleep,
+                                  args.forces, args.contact_cache, args.elasticity, args.settle_frames,
+                                  args.workers)
+                results["scenes"].append(scene)
+                print(f"{scene['key']}: {scene['steps_per_sec']:.2f} steps/sec", file=sys.stderr)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+class ContactCache:
+    def __init__(self, max_age: int = 2):
+        # contacts not seen for max_age frames are evicted
+        self.max_age = max_age
+        self.frame = 0
+        # (i, j) particle indices with i < j -> [last seen frame, impulse accumulated in that frame]
+        self.contacts: dict[tuple[int, int], list] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_evictions = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        # share of this frame's contacts that were already cached
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def begin_frame(self):
+        self.frame += 1
+        self.hits = 0
+        self.misses = 0
+
+    def warm_pairs(self) -> list[tuple[int, int, float]]:
+        # last frame's contacts with the impulse they accumulated, strongest first
+        recent = [(key[0], key[1], entry[1]) for key, entry in self.contacts.items() if entry[0] == self.frame - 1]
+        recent.sort(key=lambda contact: contact[2], reverse=True)
+        return recent
+
+    def record(self, i: int, j: int, impulse: float):
+        key = (i, j) if i < j else (j, i)
+        entry = self.contacts.get(key)
+        if entry is None:
+            self.misses += 1
+            self.contacts[key] = [self.frame, impulse]
+        elif entry[0] != self.frame:
+            self.hits += 1
+            entry[0] = self.frame
+            entry[1] = impulse
+        else:
+            entry[1] += impulse
+
+    def end_frame(self):
+        stale = [key for key, entry in self.contacts.items() if self.frame - entry[0] >= self.max_age]
+        for key in stale:
+            del self.contacts[key]
+        self.evictions = len(stale)
+        self.total_evictions += len(stale)
+
+    def clear(self):
+        self.contacts.clear()
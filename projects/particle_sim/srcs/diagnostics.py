@@ -0,0 +1,81 @@
+import csv
+
+import numpy as np
+
+SAMPLE_FIELDS = ("frame", "kinetic_energy", "total_energy", "momentum_x", "momentum_y", "max_speed",
+                 "collisions_per_frame")
+
+
+class Diagnostics:
+    def __init__(self, sample_every: int = 10, history: int = 600, csv_path: str | None = None,
+                 drift_tolerance: float = 0.01):
+        # a sample is taken every sample_every frames and kept in a ring buffer of the last history samples
+        self.sample_every = sample_every
+        self.samples = np.zeros(history, dtype=[(field, float) for field in SAMPLE_FIELDS])
+        self.count = 0
+        self.frame = 0
+        self.last_sample_frame = 0
+        self.collisions = 0
+        # total energy of the first sample, drift is measured against it
+        self.reference_energy: float | None = None
+        self.drift_tolerance = drift_tolerance
+        self.drift_exceeded = False
+        self.csv_file = open(csv_path, "w", newline="") if csv_path else None
+        self.csv_writer = csv.writer(self.csv_file) if self.csv_file else None
+        if self.csv_writer:
+            self.csv_writer.writerow(SAMPLE_FIELDS)
+
+    @property
+    def latest(self) -> np.void | None:
+        if not self.count:
+            return None
+        return self.samples[(self.count - 1) % len(self.samples)]
+
+    @property
+    def drift(self) -> float:
+        latest = self.latest
+        if latest is None or not self.reference_energy:
+            return 0.0
+        return (latest["total_energy"] - self.reference_energy) / abs(self.reference_energy)
+
+    def history(self) -> np.ndarray:
+        # the buffered samples, oldest first
+        if self.count <= len(self.samples):
+            return self.samples[:self.count].copy()
+        start = self.count % len(self.samples)
+        return np.concatenate((self.samples[start:], self.samples[:start]))
+
+    def on_frame(self, handler):
+        # called once per step, only every sample_every-th call touches the particles
+        self.collisions += handler.collision_count
+        self.frame += 1
+        if self.frame % self.sample_every == 0 or self.count == 0:
+            self.sample(handler)
+
+    def sample(self, handler):
+        velocities = handler.get_velocities()
+        masses = handler.get_cached_masses()
+        speed2 = np.einsum("ij,ij->i", velocities, velocities)
+        kinetic = 0.5 * float(masses @ speed2)
+        potential = handler.gravity * float(masses @ (handler.height - handler.get_positions()[:, 1]))
+        momentum = masses @ velocities
+        frames = max(1, self.frame - self.last_sample_frame)
+        row = (self.frame, kinetic, kinetic + potential, momentum[0], momentum[1],
+               float(np.sqrt(speed2.max(initial=0))), self.collisions / frames)
+        self.collisions = 0
+        self.last_sample_frame = self.frame
+
+        self.samples[self.count % len(self.samples)] = row
+        self.count += 1
+        if self.reference_energy is None:
+            self.reference_energy = row[2]
+        if abs(self.drift) > self.drift_tolerance:
+            self.drift_exceeded = True
+        if self.csv_writer:
+            self.csv_writer.writerow(row)
+
+    def close(self):
+        if self.csv_file:
+            self.csv_file.close()
+            self.csv_file = None
+            self.csv_writer = None
@@ -1,11 +1,21 @@
+import argparse
 import pygame
 import random
 import math
+import numpy as np
 from particle import Particle
 from particle_collision import *
+from contact_cache import ContactCache
+from diagnostics import Diagnostics
+from nbody import NBodyForces
+from obstacles import ObstacleSet, load_scene
+from parallel import ParallelStepper
+from renderer import ParticleRenderer
+from trajectory import TrajectoryWriter
 from collections import deque
 
 WIDTH, HEIGHT = 700, 700
+GRAVITY = 0.1
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
 
@@ -21,42 +31,347 @@ class ParticleHandler:
         self.height = height
         self.grid_size = 0
         self.grid: list[list[list[Particle]]] = []
+        self.gravity = GRAVITY
+        # optional mutual forces (n-body gravity, Lennard-Jones) on top of the uniform gravity
+        self.forces: NBodyForces | None = None
+        # sampled conservation diagnostics, None costs nothing
+        self.diagnostics: Diagnostics | None = None
+        # particle-particle collisions resolved in the last resolve_collisions
+        self.collision_count = 0
+        # static segments, polygons and pegs, tested through a BVH after the particle-particle pass
+        self.obstacles: ObstacleSet | None = None
+        # array solver in shared memory, replaces the per-object stages in step() while enabled
+        self.parallel: ParallelStepper | None = None
+        self.renderer = ParticleRenderer()
+        # radii and colors only change when particles are added, so the renderer reuses them between frames
+        self.appearance: tuple[np.ndarray, np.ndarray] | None = None
+        # masses are fixed per particle too, the force stage reuses them every frame
+        self.masses: np.ndarray | None = None
+        self.recorder: TrajectoryWriter | None = None
+        self.max_radius = 0
+        self.occupied_cells: set[tuple[int, int]] = set()
+        self.max_cell_passes = 16
+        # with a contact cache the grid is updated incrementally and last frame's contacts are solved first
+        self.contact_cache: ContactCache | None = None
+        self.moved_particles = 0
+
+        # sleeping particles skip gravity, integration and the narrow phase until something hits their island
+        self._sleep_enabled = False
+        self.sleep_speed = 0.3
+        self.sleep_frames = 30
+        self.contact_margin = 1.0
+        self.awake: list[Particle] = []
+        self.sleep_grid: dict[tuple[int, int], list[Particle]] = {}
+
+    @property
+    def sleep_enabled(self) -> bool:
+        return self._sleep_enabled
+
+    @sleep_enabled.setter
+    def sleep_enabled(self, enabled: bool):
+        # particles that are already asleep would otherwise stay frozen once sleeping is turned off
+        if self._sleep_enabled and not enabled:
+            self.wake_all()
+        if enabled and self.parallel is not None:
+            raise ValueError("sleeping is not supported with parallel stepping")
+        self._sleep_enabled = enabled
+
+    @property
+    def awake_count(self) -> int:
+        return len(self.awake)
+
+    @property
+    def sleeping_count(self) -> int:
+        return len(self.particles) - len(self.awake)
 
     def generate_grid(self):
-        self.grid_size = max(p.rad for p in self.particles) * 2
+        # the grid is only reallocated when the cell size changes, assign_particles_to_grid clears it in place
+        grid_size = self.max_radius * 2
+        if grid_size == self.grid_size and self.grid:
+            return
+        self.grid_size = grid_size
         grid_width = math.ceil(self.width / self.grid_size)
         grid_height = math.ceil(self.height / self.grid_size)
         self.grid = [[[] for _ in range(grid_width)] for _ in range(grid_height)]
+        self.occupied_cells = set()
+        for particle in self.particles:
+            particle.cell = None
+        self.rebuild_sleep_grid()
 
     def grid_coordinates(self, particle):
         x_idx = int(particle.x / self.grid_size)
         y_idx = int(particle.y / self.grid_size)
         return x_idx, y_idx
 
+    def enable_contact_cache(self, enabled: bool = True, max_age: int = 2):
+        self.contact_cache = ContactCache(max_age) if enabled else None
+        # the two broad phase modes keep different bookkeeping, start from an empty grid
+        self.grid = []
+
     def assign_particles_to_grid(self):
         self.generate_grid()
-        for particle in self.particles:
+        if self.contact_cache is not None:
+            self.update_grid()
+            return
+        for x_idx, y_idx in self.occupied_cells:
+            self.grid[y_idx][x_idx].clear()
+        self.occupied_cells = set()
+        for particle in self.awake:
             x_idx, y_idx = self.grid_coordinates(particle)
+            if not (0 <= x_idx < len(self.grid[0]) and 0 <= y_idx < len(self.grid)):
+                x_idx, y_idx = self.bound_escaped(particle)
             if 0 <= x_idx < len(self.grid[0]) and 0 <= y_idx < len(self.grid):
-                self.grid[y_idx][x_idx].append(particle)
+                cell = self.grid[y_idx][x_idx]
+                if not cell:
+                    self.occupied_cells.add((x_idx, y_idx))
+                cell.append(particle)
+
+    def bound_escaped(self, particle: Particle) -> tuple[int, int]:
+        # a particle fast enough to step over a wall (or pushed over it by an obstacle) lands outside the grid,
+        # where the cell sweep would never bound it
+        particle.wall_bound(self.width, self.height)
+        return self.grid_coordinates(particle)
+
+    def remove_from_grid(self, particle: Particle):
+        x_idx, y_idx = particle.cell
+        cell = self.grid[y_idx][x_idx]
+        cell.remove(particle)
+        if not cell:
+            self.occupied_cells.remove((x_idx, y_idx))
+        particle.cell = None
+
+    def update_grid(self):
+        # only particles that crossed into another cell are moved, cells whose occupancy is unchanged are untouched
+        self.moved_particles = 0
+        grid_width, grid_height = len(self.grid[0]), len(self.grid)
+        for particle in self.awake:
+            x_idx, y_idx = self.grid_coordinates(particle)
+            inside = 0 <= x_idx < grid_width and 0 <= y_idx < grid_height
+            if not inside:
+                x_idx, y_idx = self.bound_escaped(particle)
+                inside = 0 <= x_idx < grid_width and 0 <= y_idx < grid_height
+            if inside and particle.cell == (x_idx, y_idx):
+                continue
+            if particle.cell is None and not inside:
+                continue
+            self.moved_particles += 1
+            if particle.cell is not None:
+                self.remove_from_grid(particle)
+            if inside:
+                cell = self.grid[y_idx][x_idx]
+                if not cell:
+                    self.occupied_cells.add((x_idx, y_idx))
+                cell.append(particle)
+                particle.cell = (x_idx, y_idx)
+
+    def iter_nearby(self, cells, particle):
+        # particles in the 3x3 block of cells around particle, cells is either the grid or the sleep grid
+        x, y = self.grid_coordinates(particle)
+        for ny in range(y - 1, y + 2):
+            for nx in range(x - 1, x + 2):
+                if cells is self.grid:
+                    if 0 <= nx < len(self.grid[0]) and 0 <= ny < len(self.grid):
+                        yield from self.grid[ny][nx]
+                else:
+                    yield from cells.get((nx, ny), ())
+
+    def touching(self, p1: Particle, p2: Particle) -> bool:
+        return math.hypot(p1.x - p2.x, p1.y - p2.y) <= p1.rad + p2.rad + self.contact_margin
+
+    def rebuild_sleep_grid(self):
+        self.sleep_grid = {}
+        for particle in self.particles:
+            if particle.asleep:
+                self.sleep_grid.setdefault(self.grid_coordinates(particle), []).append(particle)
+
+    def put_to_sleep(self, particle: Particle):
+        particle.asleep = True
+        particle.xv = particle.yv = 0
+        if particle.cell is not None:
+            self.remove_from_grid(particle)
+        self.sleep_grid.setdefault(self.grid_coordinates(particle), []).append(particle)
+
+    def wake_island(self, particle: Particle):
+        # wakes every sleeping particle connected to this one through resting contacts
+        particle.asleep = False
+        stack = [particle]
+        while stack:
+            p = stack.pop()
+            p.still_frames = 0
+            cell = self.grid_coordinates(p)
+            self.sleep_grid[cell].remove(p)
+            if not self.sleep_grid[cell]:
+                del self.sleep_grid[cell]
+            self.awake.append(p)
+            for other in list(self.iter_nearby(self.sleep_grid, p)):
+                if other.asleep and self.touching(p, other):
+                    other.asleep = False
+                    stack.append(other)
+
+    def wake_all(self):
+        for particle in self.particles:
+            if particle.asleep:
+                particle.asleep = False
+                particle.still_frames = 0
+        self.awake = list(self.particles)
+        self.sleep_grid = {}
+
+    def collide_with_sleeping(self):
+        # fast particles wake the island they hit, slow ones rest on it as if it were static
+        for p in list(self.awake):
+            for sleeper in list(self.iter_nearby(self.sleep_grid, p)):
+                if not sleeper.asleep or not p.overlaps_with(sleeper):
+                    continue
+                if p.speed >= self.sleep_speed:
+                    self.wake_island(sleeper)
+                    particle_collision(p, sleeper)
+                else:
+                    static_circle_collision(p, sleeper.x, sleeper.y, sleeper.rad)
+
+    def update_sleep(self):
+        candidates = []
+        for p in self.awake:
+            if p.speed < self.sleep_speed:
+                p.still_frames += 1
+                if p.still_frames >= self.sleep_frames:
+                    candidates.append(p)
+            else:
+                p.still_frames = 0
+
+        # an island only sleeps once every awake particle in contact with it has been still long enough
+        visited = set()
+        for p in candidates:
+            if id(p) in visited:
+                continue
+            visited.add(id(p))
+            island = [p]
+            settled = True
+            stack = [p]
+            while stack:
+                q = stack.pop()
+                for other in self.iter_nearby(self.grid, q):
+                    if id(other) in visited or not self.touching(q, other):
+                        continue
+                    visited.add(id(other))
+                    if other.still_frames < self.sleep_frames:
+                        settled = False
+                    island.append(other)
+                    stack.append(other)
+            if settled:
+                for q in island:
+                    self.put_to_sleep(q)
+        if candidates:
+            self.awake = [p for p in self.awake if not p.asleep]
+
+    def get_cached_masses(self) -> np.ndarray:
+        if self.masses is None:
+            self.masses = self.get_masses()
+        return self.masses
 
     def get_total_momentum(self):
-        return sum(p.momentum[0] for p in self.particles) + sum(p.momentum[1] for p in self.particles)
+        # sum of both components
+        return float((self.get_cached_masses() @ self.get_velocities()).sum())
 
     def get_total_ke(self):
-        return sum(p.kinetic_energy for p in self.particles)
+        velocities = self.get_velocities()
+        return 0.5 * float(self.get_cached_masses() @ np.einsum("ij,ij->i", velocities, velocities))
 
     def add_particle(self, particle):
+        if self.recorder is not None:
+            raise RuntimeError("cannot add particles while recording a trajectory")
+        if self.parallel is not None:
+            raise RuntimeError("cannot add particles while parallel stepping is enabled")
+        particle.index = len(self.particles)
         self.particles.append(particle)
+        self.awake.append(particle)
+        self.max_radius = max(self.max_radius, particle.rad)
+        self.appearance = None
+        self.masses = None
+
+    def enable_parallel(self, workers: int = 1, tiles: int = 8):
+        # results depend on tiles but not on workers, workers=1 is the single-core reference;
+        # the array solver is not the object solver, see parallel.py --parity for how far the two drift apart
+        if self.sleep_enabled:
+            raise ValueError("sleeping is not supported with parallel stepping")
+        if self.obstacles is not None:
+            raise ValueError("obstacles are not supported with parallel stepping")
+        self.disable_parallel()
+        self.parallel = ParallelStepper(self, workers, tiles)
+
+    def disable_parallel(self):
+        if self.parallel is not None:
+            self.parallel.store()
+            self.parallel.close()
+            self.parallel = None
+
+    def step(self):
+        if self.parallel is not None:
+            self.parallel.step()
+            self.parallel.store()
+            if self.recorder is not None:
+                self.recorder.append(self.get_positions(), self.get_velocities())
+            if self.diagnostics is not None:
+                self.diagnostics.on_frame(self)
+            return
+        self.apply_gravity()
+        self.apply_forces()
+        self.collide_all()
+        self.update_particles()
 
     def update_particles(self):
-        for particle in self.particles:
-            print(particle.x, particle.y, particle.xv, particle.yv)
+        for particle in self.awake:
             particle.move()
+        if self.sleep_enabled:
+            self.update_sleep()
+        if self.recorder is not None:
+            self.recorder.append(self.get_positions(), self.get_velocities())
+        if self.diagnostics is not None:
+            self.diagnostics.on_frame(self)
+
+    def start_recording(self, path: str, timestep: float = 1 / 60):
+        # the particle set is fixed for the length of a recording
+        self.stop_recording()
+        self.recorder = TrajectoryWriter(path, self.get_radii(), self.get_masses(), timestep, self.width, self.height)
+        self.recorder.append(self.get_positions(), self.get_velocities())
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def get_positions(self) -> np.ndarray:
+        positions = np.empty((len(self.particles), 2))
+        positions[:, 0] = [p.x for p in self.particles]
+        positions[:, 1] = [p.y for p in self.particles]
+        return positions
+
+    def get_velocities(self) -> np.ndarray:
+        velocities = np.empty((len(self.particles), 2))
+        velocities[:, 0] = [p.xv for p in self.particles]
+        velocities[:, 1] = [p.yv for p in self.particles]
+        return velocities
+
+    def get_radii(self) -> np.ndarray:
+        return np.array([p.rad for p in self.particles], dtype=float)
+
+    def get_masses(self) -> np.ndarray:
+        return np.array([p.mass for p in self.particles], dtype=float)
+
+    def get_colors(self) -> np.ndarray:
+        return np.array([p.color for p in self.particles], dtype=np.uint8).reshape(-1, 3)
 
     def draw_particles(self, surface):
-        for particle in self.particles:
-            particle.draw(surface)
+        if self.appearance is None:
+            self.appearance = self.get_radii(), self.get_colors()
+        self.renderer.draw(surface, self.get_positions(), *self.appearance)
+
+    def draw_obstacles(self, surface, color=WHITE):
+        if self.obstacles is None:
+            return
+        for x1, y1, x2, y2 in self.obstacles.segments().tolist():
+            pygame.draw.line(surface, color, (x1, y1), (x2, y2))
+        for x, y, radius in self.obstacles.pegs().tolist():
+            pygame.draw.circle(surface, color, (x, y), radius)
 
     def get_neighbors(self, x, y):
         # Get neighboring grid coordinates, including diagonals
@@ -73,13 +388,49 @@ class ParticleHandler:
     def collide_all(self):
         # Step 1: Assign particles to grids
         self.assign_particles_to_grid()
+        self.resolve_collisions()
+        self.collide_static()
+
+    def collide_static(self):
+        # everything that does not move this frame: sleeping islands and the obstacle geometry
+        if self.sleep_grid:
+            self.collide_with_sleeping()
+        if self.obstacles is not None:
+            self.obstacles.collide_particles(self.awake)
+
+    def load_obstacles(self, path: str):
+        # the array solver has no obstacle stage, it would step straight through them
+        if self.parallel is not None:
+            raise ValueError("obstacles are not supported with parallel stepping")
+        self.obstacles = load_scene(path)
+
+    def resolve_collisions(self):
+        cache = self.contact_cache
+        collisions = 0
+        if cache is not None:
+            cache.begin_frame()
+            # warm start: contacts that persist from last frame get last frame's impulse up front, so resting
+            # contacts are mostly resolved before the sweep and fewer cells get pushed back onto the stack
+            for i, j, impulse in cache.warm_pairs():
+                p1, p2 = self.particles[i], self.particles[j]
+                if not p1.asleep and not p2.asleep:
+                    impulse = apply_normal_impulse(p1, p2, impulse)
+                    if impulse:
+                        collisions += 1
+                        cache.record(i, j, impulse)
 
         # Step 2: Initialize a stack to track grids needing further collision checks
-        stack = deque((x, y) for y in range(len(self.grid)) for x in range(len(self.grid[y])))
+        # empty cells have nothing to resolve, the rest keep the row-major order of the full grid
+        stack = deque(sorted(self.occupied_cells, key=lambda cell: (cell[1], cell[0])))
+        passes: dict[tuple[int, int], int] = {}
 
         # Step 4: Process the stack until no grids are marked as True
         while stack:
             x, y = stack.pop()
+            # inelastic piles can keep re-colliding forever (inelastic collapse), so cap the work per cell
+            passes[x, y] = passes.get((x, y), 0) + 1
+            if passes[x, y] > self.max_cell_passes:
+                continue
             particles_in_grid: list[Particle] = self.grid[y][x]
 
             collided_grids = set()
@@ -87,35 +438,70 @@ class ParticleHandler:
                 if p1.wall_bound(self.width, self.height):
                     collided_grids.add((x, y))
                 for j, p2 in enumerate(particles_in_grid[i + 1:]):
-                    if particle_collision(p1, p2):
+                    impulse = particle_collision(p1, p2)
+                    if impulse:
+                        collisions += 1
                         collided_grids.add((x, y))
+                        if cache is not None:
+                            cache.record(p1.index, p2.index, impulse)
 
             for nx, ny in self.get_neighbors(x, y):
                 neighboring_particles = self.grid[ny][nx]
                 for p1 in particles_in_grid:
                     for p2 in neighboring_particles:
-                        if particle_collision(p1, p2):
+                        impulse = particle_collision(p1, p2)
+                        if impulse:
+                            collisions += 1
                             collided_grids.add((x, y))
                             collided_grids.add((nx, ny))
+                            if cache is not None:
+                                cache.record(p1.index, p2.index, impulse)
 
             stack.extend(collided_grids)
 
+        self.collision_count = collisions
+        if cache is not None:
+            cache.end_frame()
+
     def apply_gravity(self):
-        for p in self.particles:
-            p.yv += 0.1
+        for p in self.awake:
+            p.yv += self.gravity
+
+    def apply_forces(self):
+        if self.forces is None or not self.awake:
+            return
+        # every particle attracts, only awake ones are pushed
+        acc = self.forces.accelerations(self.get_positions(), self.get_cached_masses())
+        rows = np.fromiter((p.index for p in self.awake), dtype=np.int64, count=len(self.awake))
+        for p, (ax, ay) in zip(self.awake, acc[rows].tolist()):
+            p.xv += ax
+            p.yv += ay
+
+    def get_total_energy(self):
+        # kinetic plus gravitational potential, measured from the floor
+        potential = self.gravity * float(self.get_cached_masses() @ (self.height - self.get_positions()[:, 1]))
+        return self.get_total_ke() + potential
 
 
 # Game class
 class Game:
-    def __init__(self):
+    def __init__(self, record_path: str | None = None, scene_path: str | None = None,
+                 diagnostics_csv: str | None = None):
         pygame.init()
         self.running = True
         self.clock = pygame.time.Clock()
         self.particle_handler = ParticleHandler(WIDTH, HEIGHT)
+        self.particle_handler.sleep_enabled = True
+        if scene_path:
+            self.particle_handler.load_obstacles(scene_path)
         self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
         self.font = pygame.font.Font(None, 36)
         pygame.display.set_caption("Particle System with Collisions")
         self.spawn_particles()
+        if record_path:
+            self.particle_handler.start_recording(record_path)
+        # the HUD reads the latest sample instead of summing over every particle each frame
+        self.particle_handler.diagnostics = Diagnostics(sample_every=10, csv_path=diagnostics_csv)
 
     def spawn_particles(self):
         self.particle_handler.add_particle(Particle(100, 100))
@@ -145,31 +531,50 @@ class Game:
             y_offset += text_surface.get_rect().height + 5
 
 
+    def hud_text(self) -> str:
+        handler = self.particle_handler
+        sample = handler.diagnostics.latest
+        text = f"""Momentum     : {sample["momentum_x"] + sample["momentum_y"]:.2f}
+KineticEnergy: {sample["kinetic_energy"]:.2f}
+Max speed    : {sample["max_speed"]:.2f}
+Collisions   : {sample["collisions_per_frame"]:.1f}/frame
+Awake/Asleep : {handler.awake_count}/{handler.sleeping_count}
+FPS          : {self.clock.get_fps():.0f}"""
+        if handler.diagnostics.drift_exceeded:
+            text += f"\nEnergy drift : {handler.diagnostics.drift * 100:+.2f}%"
+        return text
+
     def main(self):
         while self.running:
-            self.screen.fill(BLACK)
-
             # Event handling
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.running = False
 
             # Update and draw particles
-            self.particle_handler.apply_gravity()
-            self.particle_handler.collide_all()
-            self.particle_handler.update_particles()
-            self.particle_handler.draw_particles(self.screen)
-            self.draw_text(f"""Momentum     : {self.particle_handler.get_total_momentum():.2f}
-KineticEnergy: {self.particle_handler.get_total_ke():.2f}
-FPS          : {self.clock.get_fps():.0f}""")
-
-            # Update the display
-            pygame.display.flip()
+            self.particle_handler.step()
+
+            if self.particle_handler.renderer.should_draw():
+                self.screen.fill(BLACK)
+                self.particle_handler.draw_obstacles(self.screen)
+                self.particle_handler.draw_particles(self.screen)
+                self.draw_text(self.hud_text())
+
+                # Update the display
+                pygame.display.flip()
             self.clock.tick(60)
 
+        self.particle_handler.stop_recording()
+        self.particle_handler.disable_parallel()
+        self.particle_handler.diagnostics.close()
         pygame.quit()
 
 # Run the game
 if __name__ == "__main__":
-    game = Game()
+    parser = argparse.ArgumentParser(description="Particle System with Collisions")
+    parser.add_argument("record", nargs="?", help="record the run to this trajectory file for playback.py")
+    parser.add_argument("--scene", help="obstacle scene file, see obstacles.load_scene")
+    parser.add_argument("--diagnostics-csv", help="stream the sampled energy and momentum diagnostics to this file")
+    args = parser.parse_args()
+    game = Game(args.record, args.scene, args.diagnostics_csv)
     game.main()
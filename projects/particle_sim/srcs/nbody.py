@@ -0,0 +1,333 @@
+import argparse
+import time
+
+import numpy as np
+
+MAX_DEPTH = 16
+CHUNK = 512
+# bodies per expansion group and per directly summed node
+GROUP_SIZE = 16
+LEAF_SIZE = 8
+# elements per near field block
+NEAR_BLOCK = 1 << 20
+
+
+def spread_bits(v: np.ndarray) -> np.ndarray:
+    # 0b1011 -> 0b1000101, so two spread coordinates interleave into a morton code
+    v = v.astype(np.uint64)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+
+class QuadTreeLevel:
+    def __init__(self, keys, starts, counts, mass, com, ix, iy):
+        self.keys = keys
+        self.starts = starts
+        self.counts = counts
+        self.mass = mass
+        self.com = com
+        self.ix = ix
+        self.iy = iy
+        # children live in the next level, in [child_start, child_end)
+        self.child_start: np.ndarray | None = None
+        self.child_end: np.ndarray | None = None
+
+
+class QuadTree:
+    # linear quadtree: bodies sorted by morton code, every level is a run-length split of that order
+    def __init__(self, positions: np.ndarray, masses: np.ndarray, max_depth: int = MAX_DEPTH):
+        self.depth = max_depth
+        self.origin = positions.min(axis=0)
+        self.size = max(float((positions.max(axis=0) - self.origin).max()), 1e-9)
+
+        cells = 1 << max_depth
+        q = np.minimum(((positions - self.origin) / self.size * cells).astype(np.int64), cells - 1)
+        codes = spread_bits(q[:, 0]) | (spread_bits(q[:, 1]) << np.uint64(1))
+        self.order = np.argsort(codes, kind="stable")
+        self.codes = codes[self.order]
+        self.positions = positions[self.order]
+        self.masses = masses[self.order]
+        q = q[self.order]
+
+        n = len(positions)
+        weighted = self.positions * self.masses[:, None]
+        self.levels: list[QuadTreeLevel] = []
+        for level in range(max_depth + 1):
+            shift = np.uint64(2 * (max_depth - level))
+            keys = self.codes >> shift
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+            counts = np.diff(np.r_[starts, n])
+            mass = np.add.reduceat(self.masses, starts)
+            com = np.add.reduceat(weighted, starts)
+            # massless nodes fall back to their first body so they stay finite
+            np.divide(com, mass[:, None], out=com, where=mass[:, None] != 0)
+            com[mass == 0] = self.positions[starts[mass == 0]]
+            self.levels.append(QuadTreeLevel(keys[starts], starts, counts, mass, com,
+                                             q[starts, 0] >> (max_depth - level),
+                                             q[starts, 1] >> (max_depth - level)))
+            # once every node holds a single body the deeper levels are copies of this one
+            if len(starts) == n:
+                break
+
+        for parent, child in zip(self.levels, self.levels[1:]):
+            child_parent_keys = child.keys >> np.uint64(2)
+            parent.child_start = np.searchsorted(child_parent_keys, parent.keys, "left")
+            parent.child_end = np.searchsorted(child_parent_keys, parent.keys, "right")
+
+    def node_size(self, level: int) -> float:
+        return self.size / (1 << level)
+
+    def groups(self, group_size: int) -> "QuadTreeGroups":
+        # the largest nodes holding at most group_size bodies, they partition the sorted bodies
+        starts, counts, keys, depths = [], [], [], []
+        parent_big = np.ones(1, dtype=bool)
+        for depth, level in enumerate(self.levels):
+            if depth:
+                parent = self.levels[depth - 1]
+                parent_index = np.searchsorted(parent.keys, level.keys >> np.uint64(2))
+                parent_big = parent.counts[parent_index] > group_size
+            leaf = parent_big & ((level.counts <= group_size) | (depth == len(self.levels) - 1))
+            starts.append(level.starts[leaf])
+            counts.append(level.counts[leaf])
+            keys.append(level.keys[leaf])
+            depths.append(np.full(leaf.sum(), depth))
+        starts, counts, keys, depths = map(np.concatenate, (starts, counts, keys, depths))
+        order = np.argsort(starts)
+        return QuadTreeGroups(self, starts[order], counts[order], keys[order], depths[order])
+
+    def overlaps(self, groups: "QuadTreeGroups", group: np.ndarray, depth: int, level: QuadTreeLevel,
+                 node: np.ndarray) -> np.ndarray:
+        # true where the node contains the group or lies inside it
+        group_depth = groups.depths[group]
+        group_key = groups.keys[group]
+        node_key = level.keys[node]
+        shallow = group_depth >= depth
+        shift = np.abs(group_depth - depth).astype(np.uint64)
+        return np.where(shallow, (group_key >> shift) == node_key, (node_key >> shift) == group_key)
+
+
+class QuadTreeGroups:
+    def __init__(self, tree: QuadTree, starts, counts, keys, depths):
+        self.starts = starts
+        self.counts = counts
+        self.keys = keys
+        self.depths = depths
+        self.sizes = tree.size / (1 << depths).astype(float)
+        cells = 1 << tree.depth
+        # a group's cell is found from its first body's grid coordinate, rounded down to the group level
+        q = ((tree.positions[starts] - tree.origin) / tree.size * cells).astype(np.int64)
+        q = np.minimum(q, cells - 1) >> (tree.depth - depths)[:, None]
+        self.centers = tree.origin + (q + 0.5) * self.sizes[:, None]
+
+
+class NBodyForces:
+    def __init__(self, mode: str = "barnes_hut", G: float = 1.0, softening: float = 1.0, theta: float = 0.7,
+                 lj_epsilon: float = 0.0, lj_sigma: float = 1.0, lj_cutoff: float = 2.5):
+        # mode is "barnes_hut" or "direct" (exact O(n^2), the reference for small n)
+        if mode not in ("barnes_hut", "direct"):
+            raise ValueError(f"unknown force mode {mode!r}")
+        self.mode = mode
+        self.G = G
+        self.softening = softening
+        self.theta = theta
+        # Lennard-Jones is short range, it is only evaluated between individual bodies within lj_cutoff * sigma
+        self.lj_epsilon = lj_epsilon
+        self.lj_sigma = lj_sigma
+        self.lj_cutoff = lj_cutoff * lj_sigma
+
+    def accelerations(self, positions: np.ndarray, masses: np.ndarray) -> np.ndarray:
+        if len(positions) < 2:
+            return np.zeros_like(positions, dtype=float)
+        if self.mode == "direct":
+            return self.direct(positions, masses)
+        return self.barnes_hut(positions, masses)
+
+    def pair_accelerations(self, dx: np.ndarray, dy: np.ndarray, source_mass, own_mass, valid=None):
+        # (dx, dy) point from the body to the source, zero offsets (the body itself) contribute nothing;
+        # valid masks out padding, masses broadcast against dx
+        r2 = dx * dx
+        r2 += dy * dy
+        scale = r2 + self.softening ** 2
+        scale[scale == 0] = np.inf
+        scale *= np.sqrt(scale)
+        np.divide(self.G * source_mass, scale, out=scale)
+        if self.lj_epsilon:
+            near = (r2 > 0) & (r2 < self.lj_cutoff ** 2)
+            if valid is not None:
+                near &= valid
+            r2 = r2[near]
+            s6 = (self.lj_sigma ** 2 / r2) ** 3
+            # positive is repulsive, so it pushes against (dx, dy)
+            scale[near] -= 24 * self.lj_epsilon * (2 * s6 * s6 - s6) / r2 / np.broadcast_to(own_mass, near.shape)[near]
+        return dx * scale, dy * scale
+
+    def direct(self, positions: np.ndarray, masses: np.ndarray) -> np.ndarray:
+        acc = np.empty((len(positions), 2))
+        x, y = positions[:, 0], positions[:, 1]
+        for start in range(0, len(positions), CHUNK):
+            rows = slice(start, start + CHUNK)
+            ax, ay = self.pair_accelerations(x[None, :] - x[rows, None], y[None, :] - y[rows, None],
+                                             masses[None, :], masses[rows, None])
+            acc[rows, 0] = ax.sum(axis=1)
+            acc[rows, 1] = ay.sum(axis=1)
+        return acc
+
+    def barnes_hut(self, positions: np.ndarray, masses: np.ndarray) -> np.ndarray:
+        tree = QuadTree(np.asarray(positions, dtype=float), np.asarray(masses, dtype=float))
+        groups = tree.groups(GROUP_SIZE)
+        theta2 = self.theta ** 2
+
+        # far field: every group keeps a first order expansion of the acceleration about its centre
+        far_acc = np.zeros((len(groups.starts), 2))
+        far_jac = np.zeros((len(groups.starts), 2, 2))
+        near_groups, near_starts, near_counts = [], [], []
+
+        # the frontier holds (group, node) pairs of the current level, all groups walk the tree at once
+        group = np.arange(len(groups.starts))
+        node = np.zeros(len(group), dtype=np.int64)
+        for depth, level in enumerate(tree.levels):
+            if not len(group):
+                break
+            size = tree.node_size(depth)
+            d = level.com[node] - groups.centers[group]
+            r2 = d[:, 0] ** 2 + d[:, 1] ** 2
+            reach = size + groups.sizes[group]
+            far = (reach * reach < theta2 * r2) & ~tree.overlaps(groups, group, depth, level, node)
+            if self.lj_epsilon:
+                # short range forces need the individual bodies, so nothing within the cutoff is far
+                corner = tree.origin + np.stack((level.ix[node], level.iy[node]), axis=1) * size
+                group_corner = groups.centers[group] - groups.sizes[group, None] / 2
+                gap = np.maximum(np.maximum(corner - group_corner - groups.sizes[group, None],
+                                            group_corner - corner - size), 0)
+                far &= gap[:, 0] ** 2 + gap[:, 1] ** 2 >= self.lj_cutoff ** 2
+
+            if far.any():
+                self.add_expansions(far_acc, far_jac, group[far], d[far], level.mass[node[far]])
+            small = ~far & ((level.counts[node] <= LEAF_SIZE) | (depth == len(tree.levels) - 1))
+            if small.any():
+                near_groups.append(group[small])
+                near_starts.append(level.starts[node[small]])
+                near_counts.append(level.counts[node[small]])
+
+            expand = ~far & ~small
+            group, node = group[expand], node[expand]
+            if depth == len(tree.levels) - 1:
+                break
+            first, last = level.child_start[node], level.child_end[node]
+            fanout = last - first
+            group = np.repeat(group, fanout)
+            node = np.repeat(first - np.cumsum(fanout) + fanout, fanout) + np.arange(fanout.sum())
+
+        body_group = np.repeat(np.arange(len(groups.starts)), groups.counts)
+        offset = tree.positions - groups.centers[body_group]
+        acc = far_acc[body_group] + np.einsum("ijk,ik->ij", far_jac[body_group], offset)
+        if near_groups:
+            self.add_near_field(acc, tree, groups, np.concatenate(near_groups), np.concatenate(near_starts),
+                                np.concatenate(near_counts))
+
+        out = np.empty_like(acc)
+        out[tree.order] = acc
+        return out
+
+    def add_expansions(self, far_acc, far_jac, group, d, node_mass):
+        # softened gravity and its gradient at the group centre, d points from the centre to the node
+        dx, dy = d[:, 0], d[:, 1]
+        soft2 = dx * dx + dy * dy + self.softening ** 2
+        inv3 = self.G * node_mass / (soft2 * np.sqrt(soft2))
+        inv5 = 3 * inv3 / soft2
+        count = len(far_acc)
+        far_acc[:, 0] += np.bincount(group, dx * inv3, count)
+        far_acc[:, 1] += np.bincount(group, dy * inv3, count)
+        # da/dx = G m (3 d d^T / s^5 - I / s^3) with x the evaluation point, symmetric
+        cross = np.bincount(group, inv5 * dx * dy, count)
+        far_jac[:, 0, 0] += np.bincount(group, inv5 * dx * dx - inv3, count)
+        far_jac[:, 0, 1] += cross
+        far_jac[:, 1, 0] += cross
+        far_jac[:, 1, 1] += np.bincount(group, inv5 * dy * dy - inv3, count)
+
+    def add_near_field(self, acc, tree, groups, group, source_starts, source_counts):
+        # every group gathers the bodies of all its small nodes into one source list, the exact sums then run
+        # as padded (groups, group bodies, sources) blocks; sorting groups by list length keeps the padding small
+        order = np.argsort(group, kind="stable")
+        group, source_starts, source_counts = group[order], source_starts[order], source_counts[order]
+        ends = np.cumsum(source_counts)
+        sources = np.repeat(source_starts - ends + source_counts, source_counts) + np.arange(ends[-1])
+        lengths = np.bincount(group, source_counts, len(groups.starts)).astype(np.int64)
+        list_starts = np.cumsum(lengths) - lengths
+        rank = np.argsort(lengths, kind="stable")
+        rank = rank[lengths[rank] > 0]
+
+        # single precision halves the memory traffic, its rounding is far below the tree's own error;
+        # Lennard-Jones terms grow too steeply for it
+        dtype = np.float64 if self.lj_epsilon else np.float32
+        x, y = tree.positions[:, 0].astype(dtype), tree.positions[:, 1].astype(dtype)
+        masses = tree.masses.astype(dtype)
+        sorted_lengths = lengths[rank]
+        i = 0
+        while i < len(rank):
+            # as many groups as fit the block budget, the last (longest) list sets the block width
+            widths = np.arange(1, len(rank) - i + 1) * sorted_lengths[i:]
+            count = max(1, int(np.searchsorted(widths, NEAR_BLOCK // GROUP_SIZE, "right")))
+            chunk = rank[i:i + count]
+            i += count
+            bodies, body_valid = self.padded_ranges(groups.starts[chunk], groups.counts[chunk])
+            slots, source_valid = self.padded_ranges(list_starts[chunk], lengths[chunk])
+            chunk_sources = sources[slots]
+            source_mass = np.where(source_valid, masses[chunk_sources], 0)[:, None, :]
+            ax, ay = self.pair_accelerations(x[chunk_sources][:, None, :] - x[bodies][:, :, None],
+                                             y[chunk_sources][:, None, :] - y[bodies][:, :, None],
+                                             source_mass, masses[bodies][:, :, None], source_valid[:, None, :])
+            # every body belongs to exactly one group, so the rows can be added without bincount
+            bodies = bodies[body_valid]
+            acc[bodies, 0] += ax.sum(axis=2)[body_valid]
+            acc[bodies, 1] += ay.sum(axis=2)[body_valid]
+
+    @staticmethod
+    def padded_ranges(starts: np.ndarray, counts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # rows of indices starts[i] .. starts[i] + counts[i], padded by repeating the first index
+        offsets = np.arange(counts.max())
+        valid = offsets[None, :] < counts[:, None]
+        return starts[:, None] + np.where(valid, offsets[None, :], 0), valid
+
+
+def relative_error(approx: np.ndarray, exact: np.ndarray) -> np.ndarray:
+    scale = np.linalg.norm(exact, axis=1)
+    return np.linalg.norm(approx - exact, axis=1) / np.where(scale > 0, scale, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Barnes-Hut accuracy and timing check")
+    parser.add_argument("--bodies", type=int, default=50000)
+    parser.add_argument("--check", type=int, default=2000, help="bodies used for the exact comparison")
+    parser.add_argument("--theta", type=float, default=0.7)
+    parser.add_argument("--softening", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    forces = NBodyForces(theta=args.theta, softening=args.softening)
+    exact = NBodyForces("direct", softening=args.softening)
+
+    positions = rng.uniform(0, 1000, (args.check, 2))
+    masses = rng.uniform(1, 10, args.check)
+    error = relative_error(forces.accelerations(positions, masses), exact.accelerations(positions, masses))
+    print(f"theta={args.theta} n={args.check}: median error {np.median(error):.2e}, "
+          f"99th {np.percentile(error, 99):.2e}, max {error.max():.2e}")
+
+    positions = rng.uniform(0, 1000, (args.bodies, 2))
+    masses = rng.uniform(1, 10, args.bodies)
+    timings = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        forces.accelerations(positions, masses)
+        timings.append(time.perf_counter() - start)
+    print(f"barnes-hut n={args.bodies}: {np.median(timings):.3f}s per evaluation (median of {args.repeats})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import argparse
+import math
+import time
+
+import numpy as np
+
+from particle import Particle
+from particle_collision import static_circle_collision
+
+# primitives per BVH leaf
+LEAF_SIZE = 4
+
+
+class ObstacleSet:
+    # every obstacle is stored as a capsule: a segment a-b swept by a radius, so a wall is a capsule of
+    # radius 0 and a peg is one whose ends coincide; polygons are their closed chain of edges
+    def __init__(self, segments: list[tuple[float, float, float, float]], pegs: list[tuple[float, float, float]]):
+        capsules = [(x1, y1, x2, y2, 0.0) for x1, y1, x2, y2 in segments] + [(x, y, x, y, r) for x, y, r in pegs]
+        self.capsules = np.array(capsules, dtype=float).reshape(-1, 5)
+        self.segment_count = len(segments)
+        self.build()
+
+    def __len__(self) -> int:
+        return len(self.capsules)
+
+    def build(self):
+        # top-down median split on the longest axis; nodes are flat arrays, a leaf owns order[start:start + count]
+        ax, ay, bx, by, r = self.capsules.T
+        box_min = np.stack((np.minimum(ax, bx) - r, np.minimum(ay, by) - r), axis=1)
+        box_max = np.stack((np.maximum(ax, bx) + r, np.maximum(ay, by) + r), axis=1)
+        centers = (box_min + box_max) / 2
+        self.order = np.arange(len(self.capsules))
+        node_min, node_max, left, right, starts, counts = [], [], [], [], [], []
+
+        def new_node(start, end):
+            items = self.order[start:end]
+            node_min.append(box_min[items].min(axis=0) if len(items) else np.zeros(2))
+            node_max.append(box_max[items].max(axis=0) if len(items) else np.zeros(2))
+            left.append(-1)
+            right.append(-1)
+            starts.append(start)
+            counts.append(end - start)
+            return len(starts) - 1
+
+        stack = [(new_node(0, len(self.order)), 0, len(self.order))]
+        while stack:
+            node, start, end = stack.pop()
+            if end - start <= LEAF_SIZE:
+                continue
+            items = self.order[start:end]
+            axis = int(np.argmax(node_max[node] - node_min[node]))
+            middle = (end - start) // 2
+            self.order[start:end] = items[np.argpartition(centers[items, axis], middle)]
+            left[node] = new_node(start, start + middle)
+            right[node] = new_node(start + middle, end)
+            counts[node] = 0
+            stack.append((left[node], start, start + middle))
+            stack.append((right[node], start + middle, end))
+
+        self.node_min = np.array(node_min).reshape(-1, 2)
+        self.node_max = np.array(node_max).reshape(-1, 2)
+        self.left = np.array(left, dtype=np.int64)
+        self.right = np.array(right, dtype=np.int64)
+        self.starts = np.array(starts, dtype=np.int64)
+        self.counts = np.array(counts, dtype=np.int64)
+        # plain lists for the per-particle query, indexing them is much cheaper than indexing arrays one by one
+        self.nodes = list(zip(*(a.tolist() for a in (self.node_min[:, 0], self.node_min[:, 1], self.node_max[:, 0],
+                                                     self.node_max[:, 1], self.left, self.right, self.starts,
+                                                     self.counts))))
+        self.order_list = self.order.tolist()
+
+    def query(self, x: float, y: float, radius: float) -> list[int]:
+        # candidates from every leaf whose box meets the circle's box, visiting O(log n) nodes for a small circle;
+        # a superset of the obstacles actually touched
+        found = []
+        if not self.nodes:
+            return found
+        stack = [0]
+        while stack:
+            min_x, min_y, max_x, max_y, left, right, start, count = self.nodes[stack.pop()]
+            if x + radius < min_x or x - radius > max_x or y + radius < min_y or y - radius > max_y:
+                continue
+            if left < 0:
+                found.extend(self.order_list[start:start + count])
+            else:
+                stack.append(left)
+                stack.append(right)
+        return found
+
+    def query_batch(self, positions: np.ndarray, radii: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # the same candidates as query() for every particle, as (particle, obstacle) pairs; all particles walk
+        # the tree at once
+        particle = np.arange(len(positions))
+        node = np.zeros(len(particle), dtype=np.int64)
+        found_particles, found_obstacles = [], []
+        if not len(self.capsules):
+            particle = particle[:0]
+        while len(particle):
+            low = positions[particle] - radii[particle, None]
+            high = positions[particle] + radii[particle, None]
+            hit = np.all((high >= self.node_min[node]) & (low <= self.node_max[node]), axis=1)
+            particle, node = particle[hit], node[hit]
+            leaf = self.left[node] < 0
+            counts = self.counts[node[leaf]]
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            found_particles.append(np.repeat(particle[leaf], counts))
+            found_obstacles.append(self.order[np.repeat(self.starts[node[leaf]], counts) + offsets])
+            particle, node = particle[~leaf], node[~leaf]
+            particle = np.concatenate((particle, particle))
+            node = np.concatenate((self.left[node], self.right[node]))
+        if not found_particles:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(found_particles), np.concatenate(found_obstacles)
+
+    def closest_points(self, positions: np.ndarray, obstacles: np.ndarray) -> np.ndarray:
+        # closest point on each obstacle's core segment to the matching position
+        ax, ay, bx, by = self.capsules[obstacles, :4].T
+        ex, ey = bx - ax, by - ay
+        length2 = ex * ex + ey * ey
+        t = ((positions[:, 0] - ax) * ex + (positions[:, 1] - ay) * ey) / np.where(length2 > 0, length2, 1)
+        t = np.clip(t, 0, 1)
+        return np.stack((ax + t * ex, ay + t * ey), axis=1)
+
+    def contacts(self, positions: np.ndarray, radii: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # batched narrow phase: (particle, obstacle, closest point) for every overlapping pair
+        particle, obstacle = self.query_batch(positions, radii)
+        points = self.closest_points(positions[particle], obstacle)
+        gap = np.hypot(*(positions[particle] - points).T) - radii[particle] - self.capsules[obstacle, 4]
+        touching = gap < 0
+        return particle[touching], obstacle[touching], points[touching]
+
+    @staticmethod
+    def resolve(p: Particle, cx: float, cy: float, radius: float) -> bool:
+        # push the particle out of the capsule like wall_bound does, then bounce it off the closest point
+        dx, dy = p.x - cx, p.y - cy
+        distance = math.hypot(dx, dy)
+        reach = p.rad + radius
+        if distance >= reach or distance == 0:
+            return False
+        p.x = cx + dx / distance * reach
+        p.y = cy + dy / distance * reach
+        static_circle_collision(p, cx, cy, radius)
+        return True
+
+    def collide_particles(self, particles: list[Particle]) -> list[Particle]:
+        # one batched query for the whole list, only the particles that touch something are visited in python;
+        # returns the particles that were pushed
+        if not particles or not len(self.capsules):
+            return []
+        positions = np.array([(p.x, p.y) for p in particles], dtype=float)
+        radii = np.array([p.rad for p in particles], dtype=float)
+        particle, obstacle, points = self.contacts(positions, radii)
+        pushed = []
+        for i, (cx, cy), radius in zip(particle.tolist(), points.tolist(), self.capsules[obstacle, 4].tolist()):
+            if self.resolve(particles[i], cx, cy, radius):
+                pushed.append(particles[i])
+        return pushed
+
+    def segments(self) -> np.ndarray:
+        return self.capsules[:self.segment_count, :4]
+
+    def pegs(self) -> np.ndarray:
+        return self.capsules[self.segment_count:][:, [0, 1, 4]]
+
+
+def load_scene(path: str) -> ObstacleSet:
+    # one obstacle per line, # starts a comment:
+    #   segment x1 y1 x2 y2
+    #   polygon x1 y1 x2 y2 x3 y3 ...   (closed, edges only)
+    #   peg x y radius
+    segments, pegs = [], []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            fields = line.split("#", 1)[0].split()
+            if not fields:
+                continue
+            kind, values = fields[0], [float(v) for v in fields[1:]]
+            if kind == "segment" and len(values) == 4:
+                segments.append(tuple(values))
+            elif kind == "polygon" and len(values) >= 6 and len(values) % 2 == 0:
+                points = list(zip(values[::2], values[1::2]))
+                segments.extend((*a, *b) for a, b in zip(points, points[1:] + points[:1]))
+            elif kind == "peg" and len(values) == 3:
+                pegs.append(tuple(values))
+            else:
+                raise ValueError(f"{path}:{line_number}: cannot parse {line.strip()!r}")
+    return ObstacleSet(segments, pegs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BVH query scaling and correctness check")
+    parser.add_argument("--obstacles", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--particles", type=int, default=20000)
+    parser.add_argument("--radius", type=float, default=3.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    positions = rng.uniform(0, 1000, (args.particles, 2))
+    radii = np.full(args.particles, args.radius)
+    for count in args.obstacles:
+        # short random segments plus a quarter as many pegs, spread over the same square
+        starts = rng.uniform(0, 1000, (count, 2))
+        segments = np.concatenate((starts, starts + rng.uniform(-5, 5, (count, 2))), axis=1)
+        pegs = np.concatenate((rng.uniform(0, 1000, (count // 4, 2)), rng.uniform(1, 5, (count // 4, 1))), axis=1)
+        obstacles = ObstacleSet(segments.tolist(), pegs.tolist())
+
+        start = time.perf_counter()
+        particle, obstacle, _ = obstacles.contacts(positions, radii)
+        batch = time.perf_counter() - start
+        start = time.perf_counter()
+        for x, y in positions[:1000].tolist():
+            obstacles.query(x, y, args.radius)
+        single = (time.perf_counter() - start) / 1000
+
+        # brute force over every obstacle for a sample of particles
+        r = obstacles.capsules[:, 4]
+        sample = positions[:200]
+        points = [obstacles.closest_points(np.repeat(p[None], len(obstacles), axis=0), np.arange(len(obstacles)))
+                  for p in sample]
+        expected = [set(np.flatnonzero(np.hypot(*(p - q).T) < args.radius + r).tolist())
+                    for p, q in zip(sample, points)]
+        found = [set(obstacle[particle == i].tolist()) for i in range(len(sample))]
+        match = "matches" if expected == found else "DIFFERS from"
+        print(f"{len(obstacles)} obstacles: {args.particles} particles in {batch * 1000:.1f}ms batched, "
+              f"{single * 1e6:.1f}us per single query, {match} brute force")
+
+
+if __name__ == "__main__":
+    main()
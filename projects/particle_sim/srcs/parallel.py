@@ -0,0 +1,259 @@
+import argparse
+import os
+import time
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+# per particle float64 columns kept in shared memory
+FIELDS = ("x", "y", "xv", "yv", "rad", "mass", "elasticity")
+# half of the 3x3 neighbourhood, so every pair of cells is visited once
+NEIGHBOUR_OFFSETS = ((0, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+
+_worker_arrays: dict[str, np.ndarray] = {}
+
+
+class SharedParticleArrays:
+    def __init__(self, count: int, names: dict[str, str] | None = None):
+        # creates the blocks when names is None, attaches to existing ones otherwise
+        self.count = count
+        self.blocks: dict[str, shared_memory.SharedMemory] = {}
+        self.arrays: dict[str, np.ndarray] = {}
+        for field in FIELDS + ("order",):
+            if names is None:
+                block = shared_memory.SharedMemory(create=True, size=max(1, count * 8))
+            else:
+                block = shared_memory.SharedMemory(name=names[field])
+            dtype = np.int64 if field == "order" else np.float64
+            self.blocks[field] = block
+            self.arrays[field] = np.ndarray((count,), dtype=dtype, buffer=block.buf)
+
+    @property
+    def names(self) -> dict[str, str]:
+        return {field: block.name for field, block in self.blocks.items()}
+
+    def close(self, unlink: bool = False):
+        self.arrays.clear()
+        for block in self.blocks.values():
+            block.close()
+            if unlink:
+                block.unlink()
+        self.blocks.clear()
+
+
+def find_pairs(x, y, rad, idx, cell_size) -> tuple[np.ndarray, np.ndarray]:
+    # overlapping pairs among the particles idx, as positions into idx
+    if len(idx) < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    cx = np.floor(x[idx] / cell_size).astype(np.int64)
+    cy = np.floor(y[idx] / cell_size).astype(np.int64)
+    cx -= cx.min() - 1
+    cy -= cy.min() - 1
+    width = cx.max() + 2
+    keys = cy * width + cx
+    order = np.argsort(keys, kind="stable")
+    cells, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+
+    first, second = [], []
+    for dx, dy in NEIGHBOUR_OFFSETS:
+        target = cells + dy * width + dx
+        found = np.minimum(np.searchsorted(cells, target), len(cells) - 1)
+        hit = np.flatnonzero(cells[found] == target)
+        a_start, a_count = starts[hit], counts[hit]
+        b_start, b_count = starts[found[hit]], counts[found[hit]]
+        fanout = a_count * b_count
+        pair = np.repeat(np.arange(len(hit)), fanout)
+        local = np.arange(fanout.sum()) - np.repeat(np.cumsum(fanout) - fanout, fanout)
+        i = a_start[pair] + local // b_count[pair]
+        j = b_start[pair] + local % b_count[pair]
+        if (dx, dy) == (0, 0):
+            keep = i < j
+            i, j = i[keep], j[keep]
+        first.append(order[i])
+        second.append(order[j])
+    i, j = np.concatenate(first), np.concatenate(second)
+
+    gi, gj = idx[i], idx[j]
+    reach = rad[gi] + rad[gj]
+    close = (x[gi] - x[gj]) ** 2 + (y[gi] - y[gj]) ** 2 <= reach * reach
+    return i[close], j[close]
+
+
+def resolve_pairs(arrays: dict[str, np.ndarray], idx: np.ndarray, i: np.ndarray, j: np.ndarray, iterations: int):
+    # impulses of every approaching pair are summed (in pair order) each sweep, so the result does not depend
+    # on how the pairs were scheduled
+    if not len(i):
+        return
+    x, y = arrays["x"][idx], arrays["y"][idx]
+    xv, yv = arrays["xv"][idx], arrays["yv"][idx]
+    inv_mass = 1 / arrays["mass"][idx]
+    restitution = np.minimum(arrays["elasticity"][idx][i], arrays["elasticity"][idx][j])
+    nx, ny = x[j] - x[i], y[j] - y[i]
+    dist = np.hypot(nx, ny)
+    valid = dist > 0
+    i, j, restitution = i[valid], j[valid], restitution[valid]
+    nx, ny = nx[valid] / dist[valid], ny[valid] / dist[valid]
+    for _ in range(iterations):
+        approach = (xv[j] - xv[i]) * nx + (yv[j] - yv[i]) * ny
+        hit = approach < 0
+        if not hit.any():
+            break
+        impulse = np.where(hit, -(1 + restitution) * approach / (inv_mass[i] + inv_mass[j]), 0)
+        xv -= np.bincount(i, impulse * nx, len(idx)) * inv_mass
+        yv -= np.bincount(i, impulse * ny, len(idx)) * inv_mass
+        xv += np.bincount(j, impulse * nx, len(idx)) * inv_mass
+        yv += np.bincount(j, impulse * ny, len(idx)) * inv_mass
+    arrays["xv"][idx] = xv
+    arrays["yv"][idx] = yv
+
+
+def resolve_tile(arrays: dict[str, np.ndarray], start: int, end: int, cell_size: float, iterations: int):
+    # interior pass: only pairs whose particles are both owned by this tile
+    idx = arrays["order"][start:end]
+    i, j = find_pairs(arrays["x"], arrays["y"], arrays["rad"], idx, cell_size)
+    resolve_pairs(arrays, idx, i, j, iterations)
+
+
+def _init_worker(count: int, names: dict[str, str]):
+    shared = SharedParticleArrays(count, names)
+    _worker_arrays.update(shared.arrays)
+    # keep the mapping alive for the life of the worker
+    _worker_arrays["_shared"] = shared
+
+
+def _resolve_tile_task(task):
+    resolve_tile(_worker_arrays, *task)
+
+
+class ParallelStepper:
+    def __init__(self, handler, workers: int = 1, tiles: int = 8, iterations: int = 4):
+        # steps the handler's particles as arrays in shared memory; the tiling, not the worker count, decides
+        # the result, so workers=1 runs the exact same passes in-process
+        # sleeping is not part of this mode, the handler's forces are applied to the arrays
+        self.handler = handler
+        self.workers = workers
+        self.tiles = tiles
+        self.iterations = iterations
+        self.count = len(handler.particles)
+        self.shared = SharedParticleArrays(self.count)
+        self.arrays = self.shared.arrays
+        self.load()
+        self.pool = Pool(workers, _init_worker, (self.count, self.shared.names)) if workers > 1 else None
+
+    def load(self):
+        particles = self.handler.particles
+        for field, attr in zip(FIELDS, ("x", "y", "xv", "yv", "rad", "mass", "elasticity")):
+            self.arrays[field][:] = [getattr(p, attr) for p in particles]
+        self.cell_size = 2 * float(self.arrays["rad"].max(initial=0)) or 1.0
+
+    def store(self):
+        # copy the arrays back into the Particle objects, only needed when the object view is used
+        for p, x, y, xv, yv in zip(self.handler.particles, *(self.arrays[f].tolist() for f in FIELDS[:4])):
+            p.x, p.y, p.xv, p.yv = x, y, xv, yv
+
+    def partition(self) -> list[tuple[int, int]]:
+        # vertical strips by current x, particles sorted by owning strip
+        width = self.handler.width / self.tiles
+        owner = np.clip((self.arrays["x"] // width).astype(np.int64), 0, self.tiles - 1)
+        self.owner = owner
+        self.arrays["order"][:] = np.argsort(owner, kind="stable")
+        bounds = np.searchsorted(owner[self.arrays["order"]], np.arange(self.tiles + 1))
+        return [(int(bounds[t]), int(bounds[t + 1])) for t in range(self.tiles)]
+
+    def resolve_boundaries(self):
+        # deterministic reconciliation of pairs that straddle strip edges, done after every interior pass
+        width = self.handler.width / self.tiles
+        x = self.arrays["x"]
+        offset = x - self.owner * width
+        margin = self.cell_size
+        near_edge = np.flatnonzero((offset < margin) | (offset > width - margin))
+        i, j = find_pairs(x, self.arrays["y"], self.arrays["rad"], near_edge, self.cell_size)
+        crossing = self.owner[near_edge[i]] != self.owner[near_edge[j]]
+        resolve_pairs(self.arrays, near_edge, i[crossing], j[crossing], self.iterations)
+
+    def bound_walls(self):
+        a = self.arrays
+        for pos, vel, limit in (("x", "xv", self.handler.width), ("y", "yv", self.handler.height)):
+            high = (a[pos] + a["rad"] > limit) & (a[vel] > 0)
+            low = (a[pos] - a["rad"] < 0) & (a[vel] < 0)
+            hit = high | low
+            a[vel][hit] *= -a["elasticity"][hit]
+            a[pos][high] = limit - a["rad"][high]
+            a[pos][low] = a["rad"][low]
+
+    def step(self):
+        a = self.arrays
+        a["yv"] += self.handler.gravity
+        if self.handler.forces is not None:
+            acc = self.handler.forces.accelerations(self.positions(), self.handler.get_cached_masses())
+            a["xv"] += acc[:, 0]
+            a["yv"] += acc[:, 1]
+        tasks = [(start, end, self.cell_size, self.iterations) for start, end in self.partition()]
+        if self.pool is None:
+            for task in tasks:
+                resolve_tile(a, *task)
+        else:
+            self.pool.map(_resolve_tile_task, tasks)
+        self.resolve_boundaries()
+        self.bound_walls()
+        a["x"] += a["xv"]
+        a["y"] += a["yv"]
+
+    def positions(self) -> np.ndarray:
+        return np.stack((self.arrays["x"], self.arrays["y"]), axis=1)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self.arrays = {}
+        self.shared.close(unlink=True)
+
+
+def main():
+    from benchmark import spawn_scene
+
+    parser = argparse.ArgumentParser(description="Compare parallel stepping against the in-process path")
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--density", type=float, default=0.2)
+    parser.add_argument("--radius-dist", default="fixed")
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--parity", action="store_true", help="also measure the drift from the collide_all path")
+    args = parser.parse_args()
+
+    # scaling beyond one worker needs as many free cores
+    print(f"{os.cpu_count()} cpu(s)")
+    reference = None
+    for workers in args.workers:
+        handler = spawn_scene(args.count, args.density, args.radius_dist, args.seed)
+        handler.enable_parallel(workers)
+        start = time.perf_counter()
+        for _ in range(args.frames):
+            handler.parallel.step()
+        elapsed = time.perf_counter() - start
+        state = np.stack([handler.parallel.arrays[f].copy() for f in FIELDS[:4]])
+        handler.disable_parallel()
+        if reference is None:
+            reference = state
+            reference_energy = handler.get_total_energy()
+        match = "identical" if np.array_equal(state, reference) else "DIFFERENT"
+        print(f"workers={workers}: {args.frames / elapsed:.2f} steps/sec, {match} to workers={args.workers[0]}")
+
+    if args.parity:
+        # the array solver sums simultaneous impulses where collide_all resolves pairs one at a time, so the
+        # two only agree statistically; this reports how far apart they end up
+        handler = spawn_scene(args.count, args.density, args.radius_dist, args.seed)
+        start_energy = handler.get_total_energy()
+        for _ in range(args.frames):
+            handler.step()
+        offset = np.hypot(*(reference[:2] - handler.get_positions().T))
+        print(f"collide_all parity after {args.frames} frames: position offset median {np.median(offset):.3g}, "
+              f"max {offset.max():.3g}; energy drift {reference_energy / start_energy - 1:+.2%} parallel, "
+              f"{handler.get_total_energy() / start_energy - 1:+.2%} collide_all")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,11 @@ class Particle:
         self.yv: float = yv
         self.mass: float = mass
         self.elasticity: float = elasticity
+        self.asleep: bool = False
+        self.still_frames: int = 0
+        # position in the handler's particle list and current broad phase cell, set by ParticleHandler
+        self.index: int = -1
+        self.cell: tuple[int, int] | None = None
 
     @property
     def momentum(self) -> tuple[float, float]:
@@ -38,19 +43,19 @@ class Particle:
         hit_wall = False
 
         if self.x + self.rad > width and self.xv > 0:
-            self.xv = -self.xv
+            self.xv = -self.xv * self.elasticity
             hit_wall = True
             self.x -= self.x + self.rad - width
         elif self.x - self.rad < 0 and self.xv < 0:
-            self.xv = -self.xv
+            self.xv = -self.xv * self.elasticity
             hit_wall = True
             self.x += - (self.x - self.rad)
         if self.y + self.rad > height and self.yv > 0:
-            self.yv = -self.yv
+            self.yv = -self.yv * self.elasticity
             hit_wall = True
             self.y -= self.y + self.rad - height
         elif self.y - self.rad < 0 and self.yv < 0:
-            self.yv = -self.yv
+            self.yv = -self.yv * self.elasticity
             hit_wall = True
             self.y += - (self.y - self.rad)
 
@@ -5,9 +5,10 @@ from particle import Particle
 def dot_product(v1, v2):
     return sum(a * b for a, b in zip(v1, v2))
 
-def particle_collision(p1: Particle, p2: Particle) -> bool:
+def particle_collision(p1: Particle, p2: Particle) -> float:
+    # returns the size of the exchanged impulse, 0 when the pair did not collide
     if not p1.overlaps_with(p2):
-        return False
+        return 0.0
     m1 = p1.mass
     m2 = p2.mass
 
@@ -15,7 +16,7 @@ def particle_collision(p1: Particle, p2: Particle) -> bool:
     distance = math.hypot(*normal_vec)
 
     if distance == 0:
-        return False
+        return 0.0
 
     normal_unit_vec = (normal_vec[0] / distance, normal_vec[1] / distance)
     tangent_unit_vec = (-normal_unit_vec[1], normal_unit_vec[0])
@@ -24,7 +25,7 @@ def particle_collision(p1: Particle, p2: Particle) -> bool:
     velocity_along_normal = dot_product(relative_velocity, normal_unit_vec)
 
     if velocity_along_normal >= 0:
-        return False
+        return 0.0
 
     # x is normal, y is tangent
     u1x = dot_product(normal_unit_vec, (p1.xv, p1.yv))
@@ -37,10 +38,53 @@ def particle_collision(p1: Particle, p2: Particle) -> bool:
     v2x = ((2 * m1) / (m1 + m2)) * u1x + ((m2 - m1) / (m1 + m2)) * u2x
     v2y = u2y
 
+    restitution = min(p1.elasticity, p2.elasticity)
+    if restitution < 1:
+        # keep the centre-of-mass velocity, scale the separating speed
+        v_cm = (m1 * u1x + m2 * u2x) / (m1 + m2)
+        v1x = v_cm + restitution * (v1x - v_cm)
+        v2x = v_cm + restitution * (v2x - v_cm)
+
     p1.xv = v1x * normal_unit_vec[0] + v1y * tangent_unit_vec[0]
     p1.yv = v1x * normal_unit_vec[1] + v1y * tangent_unit_vec[1]
     p2.xv = v2x * normal_unit_vec[0] + v2y * tangent_unit_vec[0]
     p2.yv = v2x * normal_unit_vec[1] + v2y * tangent_unit_vec[1]
 
+    return m1 * abs(v1x - u1x)
+
+
+def static_circle_collision(p: Particle, x: float, y: float, radius: float) -> bool:
+    # bounce p off an immovable circle, the circle keeps its velocity (if any)
+    normal_vec = (x - p.x, y - p.y)
+    distance = math.hypot(*normal_vec)
+    if distance == 0 or distance > p.rad + radius:
+        return False
+    normal_unit_vec = (normal_vec[0] / distance, normal_vec[1] / distance)
+    velocity_along_normal = dot_product((p.xv, p.yv), normal_unit_vec)
+    if velocity_along_normal <= 0:
+        return False
+    impulse = (1 + p.elasticity) * velocity_along_normal
+    p.xv -= impulse * normal_unit_vec[0]
+    p.yv -= impulse * normal_unit_vec[1]
     return True
 
+
+def apply_normal_impulse(p1: Particle, p2: Particle, impulse: float) -> float:
+    # push an approaching, overlapping pair apart along the contact normal with at most the impulse a full
+    # collision would exchange, so it can never add energy; returns the impulse actually applied
+    normal_vec = (p2.x - p1.x, p2.y - p1.y)
+    distance = math.hypot(*normal_vec)
+    if distance == 0 or distance > p1.rad + p2.rad:
+        return 0.0
+    normal_unit_vec = (normal_vec[0] / distance, normal_vec[1] / distance)
+    velocity_along_normal = dot_product((p2.xv - p1.xv, p2.yv - p1.yv), normal_unit_vec)
+    if velocity_along_normal >= 0:
+        return 0.0
+    reduced_mass = p1.mass * p2.mass / (p1.mass + p2.mass)
+    restitution = min(p1.elasticity, p2.elasticity)
+    impulse = min(impulse, -(1 + restitution) * reduced_mass * velocity_along_normal)
+    p1.xv -= impulse / p1.mass * normal_unit_vec[0]
+    p1.yv -= impulse / p1.mass * normal_unit_vec[1]
+    p2.xv += impulse / p2.mass * normal_unit_vec[0]
+    p2.yv += impulse / p2.mass * normal_unit_vec[1]
+    return impulse
@@ -0,0 +1,99 @@
+import math
+import sys
+
+import numpy as np
+import pygame
+
+from renderer import ParticleRenderer
+from trajectory import TrajectoryReader
+
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+GRAY = (80, 80, 80)
+BAR_HEIGHT = 8
+MAX_SPEED = 64
+
+
+class Player:
+    def __init__(self, path: str):
+        pygame.init()
+        self.trajectory = TrajectoryReader(path)
+        if not len(self.trajectory):
+            raise ValueError(f"{path} has no recorded frames")
+        self.screen = pygame.display.set_mode((int(self.trajectory.width), int(self.trajectory.height)))
+        pygame.display.set_caption(f"Playback - {path}")
+        self.font = pygame.font.Font(None, 28)
+        self.clock = pygame.time.Clock()
+        self.renderer = ParticleRenderer()
+        self.colors = np.full((self.trajectory.count, 3), 255, dtype=np.uint8)
+        self.running = True
+        self.paused = False
+        # frames advanced per displayed frame, negative plays backwards
+        self.speed = 1.0
+        self.playhead = 0.0
+
+    @property
+    def frame(self) -> int:
+        return int(self.playhead)
+
+    def seek(self, frame: float):
+        self.playhead = min(max(frame, 0), len(self.trajectory) - 1)
+
+    def seek_to_mouse(self, x: int):
+        self.seek(x / self.screen.get_width() * (len(self.trajectory) - 1))
+
+    def handle_events(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.running = False
+            elif event.type == pygame.KEYDOWN:
+                step = 10 if event.mod & pygame.KMOD_SHIFT else 1
+                if event.key == pygame.K_SPACE:
+                    self.paused = not self.paused
+                elif event.key == pygame.K_RIGHT:
+                    self.seek(self.frame + step)
+                elif event.key == pygame.K_LEFT:
+                    self.seek(self.frame - step)
+                elif event.key == pygame.K_UP:
+                    self.speed = max(-MAX_SPEED, min(MAX_SPEED, self.speed * 2))
+                elif event.key == pygame.K_DOWN:
+                    self.speed = math.copysign(max(abs(self.speed) / 2, 1 / MAX_SPEED), self.speed)
+                elif event.key == pygame.K_r:
+                    self.speed = -self.speed
+                elif event.key == pygame.K_HOME:
+                    self.seek(0)
+                elif event.key == pygame.K_END:
+                    self.seek(len(self.trajectory) - 1)
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                self.seek_to_mouse(event.pos[0])
+            elif event.type == pygame.MOUSEMOTION and event.buttons[0]:
+                self.seek_to_mouse(event.pos[0])
+
+    def draw(self):
+        self.screen.fill(BLACK)
+        self.renderer.draw(self.screen, self.trajectory.positions(self.frame), self.trajectory.radii, self.colors)
+
+        width, height = self.screen.get_size()
+        progress = self.frame / max(1, len(self.trajectory) - 1)
+        pygame.draw.rect(self.screen, GRAY, (0, height - BAR_HEIGHT, width, BAR_HEIGHT))
+        pygame.draw.rect(self.screen, WHITE, (0, height - BAR_HEIGHT, int(width * progress), BAR_HEIGHT))
+
+        seconds = self.frame * self.trajectory.timestep
+        state = "paused" if self.paused else f"x{self.speed:g}"
+        text = f"frame {self.frame}/{len(self.trajectory) - 1}  t={seconds:.2f}s  {state}"
+        self.screen.blit(self.font.render(text, True, WHITE), (10, 5))
+
+    def main(self):
+        while self.running:
+            self.handle_events()
+            if not self.paused:
+                self.seek(self.playhead + self.speed)
+            self.draw()
+            pygame.display.flip()
+            self.clock.tick(round(1 / self.trajectory.timestep))
+        pygame.quit()
+
+
+if __name__ == "__main__":
+    # space pause, left/right seek (shift for 10 frames), up/down speed, r reverse, click the bar to seek
+    Player(sys.argv[1]).main()
@@ -0,0 +1,79 @@
+import time
+
+import numpy as np
+import pygame
+
+
+class ParticleRenderer:
+    def __init__(self, splat_radius: int = 1, fps: float = 60, max_frame_skip: int = 4):
+        # particles with radius <= splat_radius are written straight into the pixel array as a single pixel,
+        # drawn after every sprite
+        self.splat_radius = splat_radius
+        self.frame_time = 1 / fps
+        self.max_frame_skip = max_frame_skip
+        self.sprites: dict[tuple[int, tuple[int, int, int]], pygame.Surface] = {}
+        self.next_frame_time: float | None = None
+        self.skipped_frames = 0
+
+    def get_sprite(self, radius: int, color: tuple[int, int, int], target: pygame.Surface) -> pygame.Surface:
+        key = (radius, color)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            # same pixels as pygame.draw.circle(surface, color, (x, y), radius) placed at (x - radius, y - radius)
+            colorkey = (0, 0, 0) if color != (0, 0, 0) else (255, 255, 255)
+            # matching the target's pixel format keeps blits free of per-pixel conversion
+            sprite = pygame.Surface((radius * 2, radius * 2), 0, target)
+            sprite.fill(colorkey)
+            pygame.draw.circle(sprite, color, (radius, radius), radius)
+            sprite.set_colorkey(colorkey, pygame.RLEACCEL)
+            sprite = self.sprites[key] = sprite
+        return sprite
+
+    def should_draw(self) -> bool:
+        # skip rendering while the simulation is behind schedule, but never more than max_frame_skip in a row
+        now = time.perf_counter()
+        if self.next_frame_time is None:
+            self.next_frame_time = now
+        self.next_frame_time += self.frame_time
+        if now <= self.next_frame_time:
+            self.skipped_frames = 0
+            return True
+        if self.skipped_frames < self.max_frame_skip:
+            self.skipped_frames += 1
+            return False
+        self.next_frame_time = now
+        self.skipped_frames = 0
+        return True
+
+    def draw(self, surface: pygame.Surface, positions: np.ndarray, radii: np.ndarray, colors: np.ndarray):
+        # colors is an (n, 3) uint8 array
+        if not len(positions):
+            return
+        radii = radii.astype(np.int64)
+        centers = positions.astype(np.int64)
+        splat = radii <= self.splat_radius
+        if not splat.all():
+            self.draw_sprites(surface, centers[~splat], radii[~splat], colors[~splat])
+        # single pixel particles go on top, a larger particle would otherwise hide them completely
+        if splat.any():
+            self.draw_points(surface, centers[splat], colors[splat])
+
+    def draw_sprites(self, surface: pygame.Surface, centers: np.ndarray, radii: np.ndarray, colors: np.ndarray):
+        # one sprite lookup per distinct (radius, color) instead of one per particle
+        colors = colors.astype(np.int64)
+        codes = (radii << 24) | (colors[:, 0] << 16) | (colors[:, 1] << 8) | colors[:, 2]
+        keys, inverse = np.unique(codes, return_inverse=True)
+        sprites = np.empty(len(keys), dtype=object)
+        for i, code in enumerate(keys.tolist()):
+            sprites[i] = self.get_sprite(code >> 24, ((code >> 16) & 255, (code >> 8) & 255, code & 255), surface)
+        corners = zip((centers[:, 0] - radii).tolist(), (centers[:, 1] - radii).tolist())
+        surface.blits(zip(sprites[inverse].tolist(), corners), doreturn=False)
+
+    @staticmethod
+    def draw_points(surface: pygame.Surface, centers: np.ndarray, colors: np.ndarray):
+        width, height = surface.get_size()
+        inside = (centers[:, 0] >= 0) & (centers[:, 0] < width) & (centers[:, 1] >= 0) & (centers[:, 1] < height)
+        centers = centers[inside]
+        pixels = pygame.surfarray.pixels3d(surface)
+        pixels[centers[:, 0], centers[:, 1]] = colors[inside]
+        del pixels  # unlock the surface
@@ -0,0 +1,112 @@
+import struct
+
+import numpy as np
+
+# magic, version, particle count, frame count, timestep, world width, world height
+HEADER = struct.Struct("<4sIQQddd")
+MAGIC = b"PTRJ"
+VERSION = 1
+FRAME_COUNT_OFFSET = 16
+FRAME_DTYPE = np.float32
+ALIGNMENT = 64
+CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def frames_offset(count: int) -> int:
+    # header, then radii and masses as float64, then frames aligned to ALIGNMENT
+    offset = HEADER.size + count * 8 * 2
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def frame_shape(count: int) -> tuple[int, int, int]:
+    # [0] positions, [1] velocities, each (count, 2)
+    return 2, count, 2
+
+
+class TrajectoryWriter:
+    def __init__(self, path: str, radii: np.ndarray, masses: np.ndarray, timestep: float,
+                 width: float, height: float):
+        self.path = path
+        self.count = len(radii)
+        self.frame_count = 0
+        self.offset = frames_offset(self.count)
+        self.frame_bytes = int(np.prod(frame_shape(self.count))) * np.dtype(FRAME_DTYPE).itemsize
+        # grow the mapping a chunk at a time so appending is a plain array store
+        self.chunk_frames = max(1, CHUNK_BYTES // max(1, self.frame_bytes))
+        self.capacity = 0
+        self.frames: np.memmap | None = None
+
+        self.file = open(path, "w+b")
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.count, 0, timestep, width, height))
+        self.file.write(np.asarray(radii, dtype=np.float64).tobytes())
+        self.file.write(np.asarray(masses, dtype=np.float64).tobytes())
+        self.file.flush()
+        self.header = np.memmap(self.file, dtype=np.uint64, mode="r+", offset=FRAME_COUNT_OFFSET, shape=(1,))
+
+    def grow(self):
+        if self.frames is not None:
+            self.frames.flush()
+        self.capacity += self.chunk_frames
+        self.file.truncate(self.offset + self.capacity * self.frame_bytes)
+        self.frames = np.memmap(self.file, dtype=FRAME_DTYPE, mode="r+", offset=self.offset,
+                                shape=(self.capacity, *frame_shape(self.count)))
+
+    def append(self, positions: np.ndarray, velocities: np.ndarray):
+        if self.frame_count == self.capacity:
+            self.grow()
+        frame = self.frames[self.frame_count]
+        frame[0] = positions
+        frame[1] = velocities
+        self.frame_count += 1
+        # the stored count only covers complete frames, so a crashed run is still readable
+        self.header[0] = self.frame_count
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.frames is not None:
+            self.frames.flush()
+        self.header.flush()
+        self.frames = None
+        self.header = None
+        self.file.truncate(self.offset + self.frame_count * self.frame_bytes)
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrajectoryReader:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, count, frame_count, timestep, width, height = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a trajectory file")
+            if version != VERSION:
+                raise ValueError(f"{path} has unsupported trajectory version {version}")
+            self.radii = np.frombuffer(f.read(count * 8), dtype=np.float64)
+            self.masses = np.frombuffer(f.read(count * 8), dtype=np.float64)
+        self.count = count
+        self.frame_count = frame_count
+        self.timestep = timestep
+        self.width = width
+        self.height = height
+        if frame_count:
+            self.frames = np.memmap(path, dtype=FRAME_DTYPE, mode="r", offset=frames_offset(count),
+                                    shape=(frame_count, *frame_shape(count)))
+        else:
+            self.frames = np.empty((0, *frame_shape(count)), dtype=FRAME_DTYPE)
+
+    def __len__(self):
+        return self.frame_count
+
+    def positions(self, frame: int) -> np.ndarray:
+        # views into the mapping, nothing is copied until the pages are touched
+        return self.frames[frame, 0]
+
+    def velocities(self, frame: int) -> np.ndarray:
+        return self.frames[frame, 1]
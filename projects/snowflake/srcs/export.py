@@ -0,0 +1,126 @@
+import os
+
+# headless: set before pygame (and main, which initializes it on import) are loaded
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+# SDL would turn the SIGTERM of Pool.terminate into a quit event and the workers would never exit
+os.environ.setdefault("SDL_NO_SIGNAL_HANDLERS", "1")
+
+import argparse
+import math
+import struct
+import time
+import zlib
+from multiprocessing import get_context
+
+import numpy as np
+import pygame
+
+from main import StrokeDocument, build_triangle_mask, mirror_sources
+
+# Side of the square tiles the snowflake is rendered in, a row of tiles is the most that is held in memory
+EXPORT_TILE = 512
+
+# Set in each worker by init_worker
+_document = None
+_export = None
+
+
+class PngWriter:
+    def __init__(self, path, width, height):
+        # An 8 bit RGBA PNG written a band of rows at a time, every band is compressed into the stream right away
+        self.file = open(path, "wb")
+        self.width = width
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self.chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        self.compressor = zlib.compressobj(6)
+
+    def chunk(self, kind, data):
+        self.file.write(struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data)))
+
+    def write(self, rows):
+        # rows is (n, width, 4) uint8, every scanline gets filter type 0
+        scanlines = np.zeros((len(rows), 1 + self.width * 4), dtype=np.uint8)
+        scanlines[:, 1:] = rows.reshape(len(rows), -1)
+        data = self.compressor.compress(scanlines.tobytes())
+        if data:
+            self.chunk(b"IDAT", data)
+
+    def close(self):
+        self.chunk(b"IDAT", self.compressor.flush())
+        self.chunk(b"IEND", b"")
+        self.file.close()
+
+
+def export_size(height):
+    # The right canvas geometry of main for a hexagon height pixels tall: the left canvas dimensions and the image
+    # size
+    canvas_height = height // 2
+    canvas_width = int(canvas_height * math.tan(math.pi / 6))
+    return canvas_width, canvas_height, int(2 * canvas_height / math.cos(math.pi / 6)), 2 * canvas_height
+
+
+def init_worker(document_path, height):
+    global _document, _export
+    _document = StrokeDocument.load(document_path)
+    _export = export_size(height)
+
+
+def render_tile(rect):
+    # The tile's pixels as (height, width, 4) RGBA: only the part of the left canvas the tile mirrors is painted,
+    # at export resolution, then gathered like PaintApp.update_right_canvas does
+    x, y, width, height = rect
+    canvas_width, canvas_height, image_width, image_height = _export
+    tile_x, tile_y = np.meshgrid(np.arange(x, x + width), np.arange(y, y + height), indexing="ij")
+    src_x, src_y, inside, _ = mirror_sources(tile_x, tile_y, image_width, image_height, canvas_width, canvas_height)
+    tile = pygame.Surface((width, height), pygame.SRCALPHA)
+    tile.fill((0, 0, 0, 0))
+    if inside.any():
+        src_x, src_y = src_x[inside], src_y[inside]
+        part = pygame.Rect(src_x.min(), src_y.min(), src_x.max() - src_x.min() + 1, src_y.max() - src_y.min() + 1)
+        canvas = pygame.Surface(part.size, pygame.SRCALPHA)
+        canvas.fill((0, 0, 0, 0))
+        mask = build_triangle_mask(canvas_width, canvas_height, part)
+        _document.render(canvas, mask, canvas_height, part.topleft)
+        pixels = pygame.surfarray.pixels2d(tile)
+        pixels[inside] = pygame.surfarray.pixels2d(canvas)[src_x - part.x, src_y - part.y]
+        del pixels
+    return np.frombuffer(pygame.image.tobytes(tile, "RGBA"), dtype=np.uint8).reshape(height, width, 4)
+
+
+def export(document_path, out, height, tile_size=EXPORT_TILE, workers=None):
+    # Tiles are rendered across the pool in row-major order and each finished row of tiles is streamed to the PNG
+    _, _, image_width, image_height = export_size(height)
+    columns = range(0, image_width, tile_size)
+    tiles = [(x, y, min(tile_size, image_width - x), min(tile_size, image_height - y))
+             for y in range(0, image_height, tile_size) for x in columns]
+    writer = PngWriter(out, image_width, image_height)
+    # spawned, not forked: a forked child would inherit the parent's SDL state
+    with get_context("spawn").Pool(workers, init_worker, (document_path, height)) as pool:
+        row = []
+        for tile in pool.imap(render_tile, tiles):
+            row.append(tile)
+            if len(row) == len(columns):
+                writer.write(np.concatenate(row, axis=1))
+                row = []
+    writer.close()
+    return image_width, image_height, len(tiles)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="render a saved snowflake document to a PNG at any resolution")
+    parser.add_argument("document")
+    parser.add_argument("out", nargs="?", help="defaults to the document path with .png")
+    parser.add_argument("--height", type=int, default=8000, help="hexagon height in pixels")
+    parser.add_argument("--tile", type=int, default=EXPORT_TILE, help="tile side in pixels")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    out = args.out or os.path.splitext(args.document)[0] + ".png"
+    start = time.perf_counter()
+    width, height, tiles = export(args.document, out, args.height, args.tile, args.workers)
+    print(f"{out}: {width}x{height} in {tiles} tiles, {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import os
+
+# headless: set before pygame (and main, which initializes it on import) are loaded
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+# SDL would turn the SIGTERM of Pool.terminate into a quit event and the workers would never exit
+os.environ.setdefault("SDL_NO_SIGNAL_HANDLERS", "1")
+
+import argparse
+import math
+import random
+import time
+from multiprocessing import get_context
+
+import numpy as np
+import pygame
+
+from export import export_size
+from main import StrokeDocument, build_symmetry_map, build_triangle_mask
+
+# Set in each worker by init_worker: the options, the symmetry map and triangle mask of the output size and the
+# surfaces every image is rendered into
+_options = None
+_render = None
+
+
+def random_document(rng, canvas_height):
+    # A stroke set in the coordinates of a canvas_height left canvas. The right edge of the canvas is the arm the
+    # mirrors meet on and its bottom right corner is the center of the flake: an arm from the center, slightly bent
+    # branches off it at 45 to 70 degrees, a few loose ornaments and sometimes an erased notch
+    canvas_width = int(canvas_height * math.tan(math.pi / 6))
+    scale = canvas_height / 300
+    axis = canvas_width - 1
+    document = StrokeDocument(canvas_height)
+
+    def stroke(points, radius, eraser=False):
+        document.operations.append({"points": [[round(x), round(y)] for x, y in points],
+                                    "radius": max(1, round(radius * scale)), "eraser": eraser})
+
+    tip = canvas_height * (1 - rng.uniform(0.55, 0.95))
+    stroke([(axis, canvas_height - 1), (axis, tip)], rng.uniform(3, 7))
+    for _ in range(rng.randint(2, 5)):
+        y = rng.uniform(tip, canvas_height * 0.9)
+        length = rng.uniform(0.1, 0.45) * (canvas_height - tip)
+        angle = math.radians(rng.uniform(45, 70))
+        bend = math.radians(rng.uniform(-15, 15))
+        middle = (axis - math.sin(angle) * length / 2, y - math.cos(angle) * length / 2)
+        end = (middle[0] - math.sin(angle + bend) * length / 2, middle[1] - math.cos(angle + bend) * length / 2)
+        stroke([(axis, y), middle, end], rng.uniform(1.5, 5))
+    for _ in range(rng.randint(0, 4)):
+        x, y = rng.uniform(0.3, 1) * canvas_width, rng.uniform(0.1, 1) * canvas_height
+        points = [(x, y)]
+        for _ in range(rng.randint(1, 3)):
+            x += rng.uniform(-30, 30) * scale
+            y += rng.uniform(-30, 30) * scale
+            points.append((x, y))
+        stroke(points, rng.uniform(1, 4))
+    if rng.random() < 0.3:
+        y = rng.uniform(tip, canvas_height)
+        stroke([(axis, y), (axis - rng.uniform(5, 20) * scale, y)], rng.uniform(2, 4), eraser=True)
+    return document
+
+
+def init_worker(options):
+    global _options, _render
+    _options = options
+    canvas_width, canvas_height, width, height = export_size(options["height"])
+    symmetry_map, _ = build_symmetry_map(width, height, canvas_width, canvas_height)
+    _render = {
+        "map": symmetry_map,
+        "mask": build_triangle_mask(canvas_width, canvas_height),
+        "canvas": pygame.Surface((canvas_width, canvas_height), pygame.SRCALPHA),
+        "hexagon": pygame.Surface((width, height), pygame.SRCALPHA),
+    }
+
+
+def generate(seed):
+    # One snowflake: its strokes painted on the left canvas and gathered through the symmetry map like
+    # PaintApp.update_right_canvas, saved as a transparent PNG and, if asked, its stroke document
+    canvas, hexagon = _render["canvas"], _render["hexagon"]
+    document = random_document(random.Random(seed), canvas.get_height())
+    canvas.fill((0, 0, 0, 0))
+    document.render(canvas, _render["mask"], canvas.get_height())
+    source = np.append(pygame.surfarray.pixels2d(canvas).ravel(order="F"), 0)
+    pixels = pygame.surfarray.pixels2d(hexagon)
+    pixels[...] = source[_render["map"]]
+    del pixels
+    path = os.path.join(_options["out"], f"snowflake_{seed:06d}")
+    pygame.image.save(hexagon, path + ".png")
+    if _options["documents"]:
+        document.save(path + ".json")
+    return os.getpid()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="generate random snowflake PNGs without a display")
+    parser.add_argument("count", type=int)
+    parser.add_argument("--out", default="snowflakes")
+    parser.add_argument("--seed", type=int, default=0, help="first seed, image i uses seed + i")
+    parser.add_argument("--height", type=int, default=600, help="hexagon height in pixels")
+    parser.add_argument("--documents", action="store_true", help="also save each stroke document as JSON")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk", type=int, default=16, help="images per task")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    options = {"out": args.out, "height": args.height, "documents": args.documents}
+    workers = set()
+    start = time.perf_counter()
+    # spawned, not forked: a forked child would inherit the parent's SDL state
+    with get_context("spawn").Pool(args.workers, init_worker, (options,)) as pool:
+        for pid in pool.imap_unordered(generate, range(args.seed, args.seed + args.count), args.chunk):
+            workers.add(pid)
+    wall = time.perf_counter() - start
+
+    print(f"{args.count} snowflakes in {wall:.1f}s, {args.count / wall:.1f} images/sec on {len(workers)} workers")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
 from __future__ import annotations
+import json
 import math
+import os
 import sys
+import zlib
 from collections import deque
+from functools import lru_cache
 
+import numpy as np
 import pygame
 
 # Initialize Pygame
@@ -25,11 +30,291 @@ BLACK = (0, 0, 0)
 GRAY = (128, 128, 128)
 
 BRUSH_RADIUS = 5
-UNDO_LIMIT = 50
+# Distance between brush stamps along a stroke, as a fraction of the radius
+BRUSH_SPACING = 0.5
+# Undo keeps the pre-images of the UNDO_TILE x UNDO_TILE tiles each operation changed, up to UNDO_BUDGET bytes
+UNDO_TILE = 32
+UNDO_BUDGET = 32 << 20
+UNDO_COMPRESS = True
+# Side of the left canvas tiles a stroke's mirrored pixels are looked up by
+MIRROR_TILE = 16
+# Where Ctrl+S saves the strokes when no document was given on the command line
+DOCUMENT_PATH = "snowflake.json"
+
+
+def mirror_sources(x, y, width, height, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT):
+    # The left canvas pixel shown by the pixels (x, y) of a width x height right canvas: the polar angle around the
+    # center is folded into the upright 60 degree wedge and then mirrored into the left half, the same picture as the
+    # flipped canvas rotated six times. Returns the clipped (src_x, src_y), whether each pixel is inside the hexagon
+    # and which of the 12 mirror images it is in
+    dx = x + 0.5 - width // 2
+    dy = y + 0.5 - height // 2
+    radius = np.hypot(dx, dy)
+    polar = np.arctan2(dx, -dy)
+    angle = np.mod(polar + math.pi / 6, math.pi / 3) - math.pi / 6
+    src_x = np.floor(canvas_width - radius * np.abs(np.sin(angle))).astype(np.intp)
+    src_y = np.floor(canvas_height - radius * np.cos(angle)).astype(np.intp)
+    rotation = np.floor((polar + math.pi / 6) / (math.pi / 3)).astype(int) % 6
+    return (np.clip(src_x, 0, canvas_width - 1), np.clip(src_y, 0, canvas_height - 1), src_y >= 0,
+            rotation * 2 + (np.sin(angle) >= 0))
+
+
+def build_symmetry_map(width, height, canvas_width=CANVAS_WIDTH, canvas_height=CANVAS_HEIGHT):
+    # Indices into the left canvas pixels flattened row by row for every right canvas pixel, pixels outside the
+    # hexagon get the index one past the end; also returns the mirror image of every pixel
+    x, y = np.meshgrid(np.arange(width), np.arange(height), indexing="ij")
+    src_x, src_y, inside, images = mirror_sources(x, y, width, height, canvas_width, canvas_height)
+    index = src_y * canvas_width + src_x
+    index[~inside] = canvas_width * canvas_height
+    return index, images
+
+
+def build_triangle_mask(width=CANVAS_WIDTH, height=CANVAS_HEIGHT, rect=None):
+    # x-major like surfarray, True for the pixels of a width x height left canvas (or of rect in it) whose center is
+    # inside the drawing triangle
+    rect = rect or pygame.Rect(0, 0, width, height)
+    x, y = np.meshgrid(np.arange(rect.left, rect.right) + 0.5, np.arange(rect.top, rect.bottom) + 0.5, indexing="ij")
+    return y * width <= x * height
+
+
+@lru_cache
+def brush_sprite(color, radius, eraser=False):
+    # A paint stamp is the circle on transparent pixels, blitted normally. An eraser stamp is multiplied in: opaque
+    # white keeps the canvas and the transparent circle clears it
+    size = 2 * radius + 1
+    sprite = pygame.Surface((size, size), pygame.SRCALPHA)
+    sprite.fill((255, 255, 255, 255) if eraser else (0, 0, 0, 0))
+    pygame.draw.circle(sprite, (0, 0, 0, 0) if eraser else color, (radius, radius), radius)
+    return sprite
+
+
+def paint_line(canvas, mask, color, start_pos, end_pos, radius, eraser=False, offset=(0, 0)):
+    # Stamps the cached brush along the line, then clears whatever landed outside the triangle mask. canvas may be
+    # a part of the left canvas starting at offset, mask is then the same part. Returns the rect of canvas that was
+    # painted, None when it is all outside
+    dx = end_pos[0] - start_pos[0]
+    dy = end_pos[1] - start_pos[1]
+    steps = max(1, math.ceil(max(abs(dx), abs(dy)) / max(1.0, radius * BRUSH_SPACING)))
+    sprite = brush_sprite(color, radius, eraser)
+    flags = pygame.BLEND_RGBA_MULT if eraser else 0
+    # Rounded before the offset is taken off, round() goes to even and would move stamps between parts
+    stamps = [(round(start_pos[0] + i / steps * dx), round(start_pos[1] + i / steps * dy)) for i in range(steps)]
+    stamps.append(end_pos)
+    canvas.blits([(sprite, (x - offset[0] - radius, y - offset[1] - radius), None, flags) for x, y in stamps], False)
+
+    dirty = pygame.Rect(min(start_pos[0], end_pos[0]) - offset[0] - radius, min(start_pos[1], end_pos[1]) - offset[1]
+                        - radius, abs(dx) + 2 * radius + 1, abs(dy) + 2 * radius + 1).clip(canvas.get_rect())
+    if not dirty.width or not dirty.height:
+        return None
+    # The bottom left pixel is the last one of the rect to leave the triangle
+    if not mask[dirty.left, dirty.bottom - 1]:
+        pixels = pygame.surfarray.pixels2d(canvas)[dirty.left:dirty.right, dirty.top:dirty.bottom]
+        pixels[~mask[dirty.left:dirty.right, dirty.top:dirty.bottom]] = 0
+        del pixels
+    return dirty
+
+
+def fill_canvas(canvas, mask, white):
+    # The fill button: clear the canvas, or make the whole triangle white
+    canvas.fill((0, 0, 0, 0))
+    if white:
+        pixels = pygame.surfarray.pixels2d(canvas)
+        # map_rgb is signed, the pixel array is not
+        pixels[mask] = canvas.map_rgb((255, 255, 255, 255)) & 0xFFFFFFFF
+        del pixels
+
+
+class StrokeDocument:
+    def __init__(self, canvas_height=CANVAS_HEIGHT):
+        # Everything painted on the left canvas, in order: strokes as {"points", "radius", "eraser"} in the
+        # coordinates of a canvas_height canvas and fills as {"fill": white}. Undone operations wait in
+        # redo_operations until something new is painted
+        self.canvas_height = canvas_height
+        self.operations = []
+        self.redo_operations = []
+
+    def add_stroke(self, start_pos, radius, eraser):
+        stroke = {"points": [list(start_pos)], "radius": radius, "eraser": eraser}
+        self.operations.append(stroke)
+        self.redo_operations.clear()
+        return stroke
+
+    def add_fill(self, white):
+        self.operations.append({"fill": white})
+        self.redo_operations.clear()
+
+    def undo(self):
+        if self.operations:
+            self.redo_operations.append(self.operations.pop())
+
+    def redo(self):
+        if self.redo_operations:
+            self.operations.append(self.redo_operations.pop())
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"canvas_height": self.canvas_height, "operations": self.operations}, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        document = cls(data["canvas_height"])
+        document.operations = data["operations"]
+        return document
+
+    def render(self, canvas, mask, canvas_height=CANVAS_HEIGHT, offset=(0, 0)):
+        # Replays the operations onto a canvas_height left canvas, or onto the part of it at offset that canvas and
+        # mask cover; strokes are scaled with the canvas and those that miss the part are skipped
+        scale = canvas_height / self.canvas_height
+        part = canvas.get_rect(topleft=offset)
+        for operation in self.operations:
+            if "fill" in operation:
+                fill_canvas(canvas, mask, operation["fill"])
+                continue
+            radius = max(1, round(operation["radius"] * scale))
+            points = [(round(x * scale), round(y * scale)) for x, y in operation["points"]]
+            xs, ys = [x for x, _ in points], [y for _, y in points]
+            bounds = pygame.Rect(min(xs) - radius, min(ys) - radius, max(xs) - min(xs) + 2 * radius + 1,
+                                 max(ys) - min(ys) + 2 * radius + 1)
+            if not bounds.colliderect(part):
+                continue
+            for start_pos, end_pos in zip(points, points[1:]):
+                paint_line(canvas, mask, WHITE, start_pos, end_pos, radius, operation["eraser"], offset)
+
+
+class MirrorTiles:
+    def __init__(self, symmetry_map, images, tile_size=MIRROR_TILE):
+        # The hexagon pixels of the symmetry map grouped by the left canvas tile they come from, so a dirty rect only
+        # touches the pixels of its tiles, plus the bounding box of each tile in each of the 12 mirror images
+        width, height = symmetry_map.shape
+        inside = symmetry_map < CANVAS_WIDTH * CANVAS_HEIGHT
+        dst_x, dst_y = np.nonzero(inside)
+        src_y, src_x = np.divmod(symmetry_map[inside], CANVAS_WIDTH)
+        self.tile_size = tile_size
+        self.columns = -(-CANVAS_WIDTH // tile_size)
+        self.rows = -(-CANVAS_HEIGHT // tile_size)
+        tiles = self.rows * self.columns
+        tile = src_y // tile_size * self.columns + src_x // tile_size
+        order = np.argsort(tile, kind="stable")
+        self.dst_x, self.dst_y = dst_x[order], dst_y[order]
+        self.src_x, self.src_y = src_x[order], src_y[order]
+        self.starts = np.searchsorted(tile[order], np.arange(tiles + 1))
+
+        # Empty boxes have left > right
+        key = tile * 12 + images[inside]
+        self.boxes = np.empty((4, tiles * 12), dtype=int)
+        self.boxes[:2] = ((width,), (height,))
+        self.boxes[2:] = -1
+        for row, coords, reduce in ((0, dst_x, np.minimum), (1, dst_y, np.minimum), (2, dst_x, np.maximum),
+                                    (3, dst_y, np.maximum)):
+            reduce.at(self.boxes[row], key, coords)
+        self.boxes = self.boxes.T.reshape(tiles, 12, 4)
+
+    def select(self, rect):
+        # The (dst_x, dst_y, src_x, src_y) pixels mirrored from the tiles under rect and the rects they cover on the
+        # right canvas, at most one per mirror image
+        rect = rect.clip(0, 0, CANVAS_WIDTH, CANVAS_HEIGHT)
+        if not rect.width or not rect.height:
+            return None, []
+        first_x, last_x = rect.left // self.tile_size, (rect.right - 1) // self.tile_size
+        first_y, last_y = rect.top // self.tile_size, (rect.bottom - 1) // self.tile_size
+        rows = range(first_y * self.columns, last_y * self.columns + 1, self.columns)
+        # The tiles of one row are contiguous, so each row is one slice
+        parts = [np.arange(self.starts[row + first_x], self.starts[row + last_x + 1]) for row in rows]
+        pixels = np.concatenate(parts)
+        tiles = np.concatenate([np.arange(row + first_x, row + last_x + 1) for row in rows])
+        boxes = self.boxes[tiles]
+        low, high = boxes[..., :2].min(axis=0), boxes[..., 2:].max(axis=0)
+        rects = [pygame.Rect(x0, y0, x1 - x0 + 1, y1 - y0 + 1) for (x0, y0), (x1, y1) in zip(low, high) if x0 <= x1]
+        selected = (self.dst_x[pixels], self.dst_y[pixels], self.src_x[pixels], self.src_y[pixels])
+        return selected, rects
+
+
+class TileHistory:
+    def __init__(self, budget=UNDO_BUDGET, compress=UNDO_COMPRESS, tile_size=UNDO_TILE):
+        # Each operation is a dict of (tile x, tile y) -> the tile's pixels before the operation, optionally zlib
+        # compressed. The oldest operations are dropped once the stacks hold more than budget bytes
+        self.budget = budget
+        self.compress = compress
+        self.tile_size = tile_size
+        self.undo_stack = deque()
+        self.redo_stack = deque()
+        self.bytes = 0
+
+    def begin(self):
+        # Start a new operation, reusing the last one if nothing was captured into it
+        if not self.undo_stack or self.undo_stack[-1]:
+            self.undo_stack.append({})
+        for operation in self.redo_stack:
+            self.bytes -= self.size(operation)
+        self.redo_stack.clear()
+
+    def capture(self, canvas, rect):
+        # Save the tiles under rect that the current operation has not saved yet, call before painting into rect
+        if not self.undo_stack:
+            self.begin()
+        operation = self.undo_stack[-1]
+        for tile in self.tiles(canvas, rect):
+            if tile not in operation:
+                operation[tile] = self.read(canvas, tile)
+                self.bytes += len(operation[tile])
+        while self.bytes > self.budget and len(self.undo_stack) > 1:
+            self.bytes -= self.size(self.undo_stack.popleft())
+
+    def undo(self, canvas):
+        return self.swap(canvas, self.undo_stack, self.redo_stack)
+
+    def redo(self, canvas):
+        return self.swap(canvas, self.redo_stack, self.undo_stack)
+
+    def swap(self, canvas, source, target):
+        # Restore the newest operation of source and push the pixels it replaced onto target; returns the rect of
+        # the canvas that changed, None when there was nothing to restore
+        while source and not source[-1]:
+            source.pop()
+        if not source:
+            return None
+        operation = source.pop()
+        replaced = {}
+        for tile, data in operation.items():
+            replaced[tile] = self.read(canvas, tile)
+            self.write(canvas, tile, data)
+        target.append(replaced)
+        self.bytes += self.size(replaced) - self.size(operation)
+        rects = [self.rect(canvas, tile) for tile in operation]
+        return rects[0].unionall(rects[1:])
+
+    def tiles(self, canvas, rect):
+        rect = rect.clip(canvas.get_rect())
+        if not rect.width or not rect.height:
+            return []
+        return [(x, y) for y in range(rect.top // self.tile_size, (rect.bottom - 1) // self.tile_size + 1)
+                for x in range(rect.left // self.tile_size, (rect.right - 1) // self.tile_size + 1)]
+
+    def rect(self, canvas, tile):
+        rect = pygame.Rect(tile[0] * self.tile_size, tile[1] * self.tile_size, self.tile_size, self.tile_size)
+        return rect.clip(canvas.get_rect())
+
+    def read(self, canvas, tile):
+        rect = self.rect(canvas, tile)
+        data = pygame.surfarray.pixels2d(canvas)[rect.left:rect.right, rect.top:rect.bottom].tobytes()
+        return zlib.compress(data, 1) if self.compress else data
+
+    def write(self, canvas, tile, data):
+        rect = self.rect(canvas, tile)
+        pixels = pygame.surfarray.pixels2d(canvas)
+        data = zlib.decompress(data) if self.compress else data
+        pixels[rect.left:rect.right, rect.top:rect.bottom] = np.frombuffer(data, pixels.dtype).reshape(rect.size)
+        del pixels
+
+    @staticmethod
+    def size(operation):
+        return sum(len(data) for data in operation.values())
 
 
 class PaintApp:
-    def __init__(self):
+    def __init__(self, document_path=None):
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
         pygame.display.set_caption("Snowflake Generator")
 
@@ -39,104 +324,110 @@ class PaintApp:
 
         self.left_canvas.fill((0, 0, 0, 0))  # Initialize the left canvas as transparent
         self.right_canvas.fill((128, 128, 128))  # Initialize the right canvas as black
+        # The mirrored hexagon with the left canvas alpha, blitted over the gray right canvas
+        self.symmetry_map, images = build_symmetry_map(RIGHT_CANVAS_RECT.width, RIGHT_CANVAS_RECT.height)
+        self.mirror_tiles = MirrorTiles(self.symmetry_map, images)
+        self.hexagon = pygame.Surface(self.right_canvas.get_size(), pygame.SRCALPHA)
+
+        self.triangle_mask = build_triangle_mask()
+
+        # Undo history of changed tiles
+        self.history = TileHistory()
+
+        # The strokes as vectors, loaded from and saved to document_path
+        self.document_path = document_path or DOCUMENT_PATH
+        self.document = StrokeDocument()
+        self.stroke = None
+        if document_path and os.path.exists(document_path):
+            self.document = StrokeDocument.load(document_path)
+            self.document.render(self.left_canvas, self.triangle_mask)
+            self.update_right_canvas()
 
-        # Undo stack
-        self.undo_stack = deque(maxlen=UNDO_LIMIT)
-        self.redo_stack = deque(maxlen=UNDO_LIMIT)
-
-        # Drawing state
+        # Drawing state: every mouse position since the last frame waits in pending_points and is painted in one pass
         self.drawing = False
         self.eraser = False
         self.last_pos = None
+        self.pending_points = []
+
+        # The part of the left canvas the preview has not caught up with, refreshed once per frame, and whether the
+        # screen needs drawing at all
+        self.preview_dirty = None
+        self.needs_redraw = True
 
         # Fill screen button
         self.fill_button = pygame.Rect(50, 10, 150, 30)
         self.fill_with_black = False
 
+        # The font, rendered texts and everything on screen that never changes, made once
+        self.font = pygame.font.Font(None, 24)
+        self.texts = {}
+        self.background = self.build_background()
 
-    def draw_rounded_line(self, color, start_pos, end_pos, radius):
-        dx = end_pos[0] - start_pos[0]
-        dy = end_pos[1] - start_pos[1]
-        dist = max(abs(dx), abs(dy))
-
-        if dist > 0:
-            for i in range(dist):
-                x = int(start_pos[0] + float(i) / dist * dx)
-                y = int(start_pos[1] + float(i) / dist * dy)
-                if not self.is_in_triangle((x, y)):
-                    continue
-                pygame.draw.circle(self.left_canvas, color, (x, y), radius)
-
-        # Draw end caps as circles
-        if self.is_in_triangle(start_pos):
-            pygame.draw.circle(self.left_canvas, color, start_pos, radius)
-        if self.is_in_triangle(end_pos):
-            pygame.draw.circle(self.left_canvas, color, end_pos, radius)
+    def draw_rounded_line(self, color, start_pos, end_pos, radius, eraser=False):
+        return paint_line(self.left_canvas, self.triangle_mask, color, start_pos, end_pos, radius, eraser)
 
     def save_state(self):
-        self.undo_stack.append(self.left_canvas.copy())
-        self.redo_stack.clear()
+        self.history.begin()
 
     def undo(self):
-        if not self.undo_stack:
-            return
-        previous_state = self.undo_stack.pop()
-        self.redo_stack.append(self.left_canvas.copy())
-        self.left_canvas = previous_state
-        self.update_right_canvas()
+        dirty = self.history.undo(self.left_canvas)
+        if dirty is not None:
+            self.document.undo()
+            self.invalidate_preview(dirty)
 
     def redo(self):
-        if not self.redo_stack:
-            return
-        next_state = self.redo_stack.pop()
-        self.undo_stack.append(self.left_canvas.copy())
-        self.left_canvas = next_state
-        self.update_right_canvas()
+        dirty = self.history.redo(self.left_canvas)
+        if dirty is not None:
+            self.document.redo()
+            self.invalidate_preview(dirty)
 
     def toggle_fill(self):
         # Fill the left canvas with transparency or black
         self.save_state()
-        self.left_canvas.fill((0, 0, 0, 0))
-        if not self.fill_with_black:
-            pygame.draw.polygon(self.left_canvas, (255, 255, 255, 255),
-                                ((0, 0), (CANVAS_WIDTH, 0), (CANVAS_WIDTH, CANVAS_HEIGHT)))
-        self.update_right_canvas()
+        self.history.capture(self.left_canvas, self.left_canvas.get_rect())
+        fill_canvas(self.left_canvas, self.triangle_mask, not self.fill_with_black)
+        self.document.add_fill(not self.fill_with_black)
+        self.invalidate_preview()
         self.eraser = not self.fill_with_black
         self.fill_with_black = not self.fill_with_black
 
-    def update_right_canvas(self):
-        self.right_canvas.fill((128, 128, 128))  # Fill with transparent black
-
-        canvas = pygame.Surface((CANVAS_WIDTH * 2, CANVAS_HEIGHT * 2), pygame.SRCALPHA)  # Allow transparency
-        canvas.blit(self.left_canvas, (0, 0))
-        canvas.blit(pygame.transform.flip(self.left_canvas, True, False), (CANVAS_WIDTH, 0))
-        hex_center = (RIGHT_CANVAS_RECT.width // 2, RIGHT_CANVAS_RECT.height // 2)
-
-        for i in range(6):
-            angle = i * math.pi / 3
-            rotated_surface = pygame.transform.rotate(canvas, math.degrees(angle))
-            rotated_rect = rotated_surface.get_rect()
-            rotated_rect.center = hex_center
-            self.right_canvas.blit(rotated_surface, rotated_rect.topleft)
-
-    def is_in_triangle(self, pos):
-        # Check if a point is within the drawing triangle
-        x, y = pos
-        if x < 0 or x > CANVAS_WIDTH or y < 0 or y > CANVAS_HEIGHT:
-            return False
-
-        # Equilateral triangle vertices
-        p1 = (0, 0)
-        p2 = (CANVAS_WIDTH, 0)
-        p3 = (CANVAS_WIDTH, CANVAS_HEIGHT)
+    def invalidate_preview(self, dirty=None):
+        # Mark a rect of the left canvas, or all of it, for the next refresh_preview
+        dirty = dirty or self.left_canvas.get_rect()
+        self.preview_dirty = dirty if self.preview_dirty is None else self.preview_dirty.union(dirty)
 
-        # Barycentric method to determine if a point is inside the triangle
-        denominator = (p2[1] - p3[1]) * (p1[0] - p3[0]) + (p3[0] - p2[0]) * (p1[1] - p3[1])
-        a = ((p2[1] - p3[1]) * (x - p3[0]) + (p3[0] - p2[0]) * (y - p3[1])) / denominator
-        b = ((p3[1] - p1[1]) * (x - p3[0]) + (p1[0] - p3[0]) * (y - p3[1])) / denominator
-        c = 1 - a - b
-
-        return 0 <= a <= 1 and 0 <= b <= 1 and 0 <= c <= 1
+    def refresh_preview(self):
+        if self.preview_dirty is None:
+            return
+        dirty, self.preview_dirty = self.preview_dirty, None
+        self.update_right_canvas(None if dirty.contains(self.left_canvas.get_rect()) else dirty)
+        self.needs_redraw = True
+
+    def update_right_canvas(self, dirty=None):
+        # Without a dirty rect the whole hexagon is rebuilt: one gather of whole RGBA pixels through the symmetry map,
+        # the index past the end is a transparent pixel. With one, only its 12 mirror images are
+        if dirty is not None:
+            self.update_right_region(dirty)
+            return
+        source = np.append(pygame.surfarray.pixels2d(self.left_canvas).ravel(order="F"), 0)
+        pixels = pygame.surfarray.pixels2d(self.hexagon)
+        pixels[...] = source[self.symmetry_map]
+        del pixels
+        self.right_canvas.fill((128, 128, 128))
+        self.right_canvas.blit(self.hexagon, (0, 0))
+
+    def update_right_region(self, dirty):
+        selected, rects = self.mirror_tiles.select(dirty)
+        if selected is None:
+            return
+        dst_x, dst_y, src_x, src_y = selected
+        source = pygame.surfarray.pixels2d(self.left_canvas)
+        pixels = pygame.surfarray.pixels2d(self.hexagon)
+        pixels[dst_x, dst_y] = source[src_x, src_y]
+        del source, pixels
+        for rect in rects:
+            self.right_canvas.fill((128, 128, 128), rect)
+            self.right_canvas.blit(self.hexagon, rect, rect)
 
     def handle_events(self):
         for event in pygame.event.get():
@@ -144,17 +435,36 @@ class PaintApp:
                 pygame.quit()
                 sys.exit()
 
-            if event.type == pygame.MOUSEBUTTONDOWN:
+            # Wheel ticks also arrive as a button 4 or 5 press and release, the painter has no use for them
+            if event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP) and event.button in (4, 5):
+                continue
+
+            # Moving the mouse without drawing changes nothing on screen
+            if event.type != pygame.MOUSEMOTION or self.drawing:
+                self.needs_redraw = True
+
+            # Strokes are the left button's alone, another press mid stroke would split its undo step from its
+            # document record
+            if event.type == pygame.MOUSEBUTTONDOWN and not self.drawing:
                 if self.fill_button.collidepoint(event.pos):
                     self.toggle_fill()
-                else:
+                elif event.button == 1:
                     self.drawing = True
-                    self.last_pos = (event.pos[0] - LEFT_CANVAS_RECT.x, event.pos[1] - LEFT_CANVAS_RECT.y)
+                    self.last_pos = self.canvas_pos(event.pos)
+                    # A click without moving still paints a dot
+                    self.pending_points.append(self.last_pos)
                     self.save_state()
 
-            if event.type == pygame.MOUSEBUTTONUP:
+            if event.type == pygame.MOUSEMOTION and self.drawing:
+                self.pending_points.append(self.canvas_pos(event.pos))
+
+            if event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                if self.drawing:
+                    self.pending_points.append(self.canvas_pos(event.pos))
+                    self.do_mouse_draw()
                 self.drawing = False
                 self.last_pos = None
+                self.stroke = None
 
             if event.type == pygame.KEYDOWN:
                 CTRL_DOWN = pygame.key.get_mods() & pygame.KMOD_CTRL
@@ -163,64 +473,86 @@ class PaintApp:
                     self.undo()
                 if event.key == pygame.K_z and CTRL_DOWN and SHIFT_DOWN:
                     self.redo()
+                if event.key == pygame.K_s and CTRL_DOWN:
+                    self.document.save(self.document_path)
                 if event.key == pygame.K_e:
                     self.eraser = not self.eraser
 
-    def draw_interface(self):
-        # Fill the background
-        self.screen.fill(GRAY)
+    def canvas_pos(self, pos):
+        return pos[0] - LEFT_CANVAS_RECT.x, pos[1] - LEFT_CANVAS_RECT.y
 
-        # Draw the fill button
-        fill_text = "Fill with Black" if self.fill_with_black else "Fill with White"
-        pygame.draw.rect(self.screen, BLACK, self.fill_button)
-        font = pygame.font.Font(None, 24)
-        text_surface = font.render(fill_text, True, WHITE)
-        self.screen.blit(text_surface, (self.fill_button.x + 10, self.fill_button.y + 5))
+    def build_background(self):
+        background = pygame.Surface(self.screen.get_size())
+        background.fill(GRAY)
+        pygame.draw.rect(background, BLACK, self.fill_button)
 
         # Draw the left canvas triangle border
-        pygame.draw.polygon(self.screen, WHITE, [
+        pygame.draw.polygon(background, WHITE, [
             (LEFT_CANVAS_RECT.x, LEFT_CANVAS_RECT.y),
             (LEFT_CANVAS_RECT.x + CANVAS_WIDTH, LEFT_CANVAS_RECT.y + CANVAS_HEIGHT),
             (LEFT_CANVAS_RECT.x + CANVAS_WIDTH, LEFT_CANVAS_RECT.y)
         ], 1)
 
         # Draw the right canvas border
-        pygame.draw.rect(self.screen, BLACK, RIGHT_CANVAS_RECT)
+        pygame.draw.rect(background, BLACK, RIGHT_CANVAS_RECT)
+        return background
+
+    def text(self, text):
+        if text not in self.texts:
+            self.texts[text] = self.font.render(text, True, WHITE)
+        return self.texts[text]
+
+    def draw_interface(self):
+        # Background, button and borders
+        self.screen.blit(self.background, (0, 0))
+
+        # Draw the fill button text
+        fill_text = "Fill with Black" if self.fill_with_black else "Fill with White"
+        self.screen.blit(self.text(fill_text), (self.fill_button.x + 10, self.fill_button.y + 5))
+
         self.screen.blit(self.left_canvas, (LEFT_CANVAS_RECT.x, LEFT_CANVAS_RECT.y))
         self.screen.blit(self.right_canvas, (RIGHT_CANVAS_RECT.x, RIGHT_CANVAS_RECT.y))
 
         # Display tool information
         tool_text = "Eraser ON" if self.eraser else "Eraser OFF"
         brush_info = f"Brush: {BRUSH_RADIUS}px | {tool_text} (Press 'E' to toggle)"
-        info_surface = font.render(brush_info, True, WHITE)
-        self.screen.blit(info_surface, (250, 10))
+        self.screen.blit(self.text(brush_info), (250, 10))
 
     def do_mouse_draw(self):
-        if not self.drawing:  # or not LEFT_CANVAS_RECT.collidepoint(pygame.mouse.get_pos()):
-            return
-        mouse_x, mouse_y = pygame.mouse.get_pos()
-        canvas_x = mouse_x - LEFT_CANVAS_RECT.x
-        canvas_y = mouse_y - LEFT_CANVAS_RECT.y
-
-        if self.last_pos:
-            if self.eraser:
-                self.draw_rounded_line((0, 0, 0, 0), self.last_pos, (canvas_x, canvas_y), BRUSH_RADIUS)
-            else:
-                self.draw_rounded_line(WHITE, self.last_pos, (canvas_x, canvas_y), BRUSH_RADIUS)
-
-            self.update_right_canvas()
-
-        self.last_pos = (canvas_x, canvas_y)
+        # Paints the segments between all the pending points in one pass; the preview is left to refresh_preview
+        for canvas_x, canvas_y in self.pending_points:
+            # Everything the brush can reach along the segment
+            self.history.capture(self.left_canvas, pygame.Rect(
+                min(self.last_pos[0], canvas_x) - BRUSH_RADIUS, min(self.last_pos[1], canvas_y) - BRUSH_RADIUS,
+                abs(canvas_x - self.last_pos[0]) + 2 * BRUSH_RADIUS + 1,
+                abs(canvas_y - self.last_pos[1]) + 2 * BRUSH_RADIUS + 1))
+            # A stroke keeps the tool it started with, so it replays the same
+            eraser = self.stroke["eraser"] if self.stroke else self.eraser
+            dirty = self.draw_rounded_line(WHITE, self.last_pos, (canvas_x, canvas_y), BRUSH_RADIUS, eraser)
+
+            # Recorded from its first painted segment on, the same point the undo history starts saving tiles
+            if self.stroke is None and dirty is not None:
+                self.stroke = self.document.add_stroke(self.last_pos, BRUSH_RADIUS, eraser)
+            if self.stroke is not None:
+                self.stroke["points"].append([canvas_x, canvas_y])
+            if dirty is not None:
+                self.invalidate_preview(dirty)
+            self.last_pos = (canvas_x, canvas_y)
+        self.pending_points.clear()
 
     def run(self):
         clock = pygame.time.Clock()
         while True:
             self.handle_events()
             self.do_mouse_draw()
-            self.draw_interface()
-            pygame.display.flip()
+            self.refresh_preview()
+            # An idle frame leaves the last one on screen
+            if self.needs_redraw:
+                self.draw_interface()
+                pygame.display.flip()
+                self.needs_redraw = False
             clock.tick(60)
 
 
 if __name__ == "__main__":
-    PaintApp().run()
+    PaintApp(sys.argv[1] if len(sys.argv) > 1 else None).run()